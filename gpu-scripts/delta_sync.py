@@ -0,0 +1,158 @@
+import io
+import json
+import struct
+import hashlib
+import numpy as np
+
+# rsync-style block delta for files that are regenerated between syncs.
+# Shared by rpi-scripts and gpu-scripts, keep both copies identical.
+#
+# The subscriber answers a get on signatures/<key prefix>/<relative_path> with the
+# weak and strong checksums of every full block of its copy. The publisher
+# slides a rolling weak checksum over the new file, confirms weak hits with
+# the strong hash and sends a delta of copy ops (ranges of the old copy) and
+# literal bytes; the subscriber rebuilds the file from it and checks the
+# result against the content hash.
+SEGMENT = 1 << 22  # offsets per vectorized rolling-checksum pass
+
+def block_size_for(size):
+    # About sqrt(size) like rsync, in whole KiB between 2 KiB and 64 KiB
+    return int(min(max(np.sqrt(size) // 1024, 2), 64)) * 1024
+
+def strong_digest(block):
+    return int.from_bytes(hashlib.blake2b(block, digest_size=8).digest(), "little")
+
+def weak_checksums(blocks):
+    # Weak checksum of each row of `blocks` (n, L) uint8: a = sum(x_i),
+    # b = sum((L - i) * x_i), packed as a & 0xffff | (b & 0xffff) << 16
+    L = blocks.shape[1]
+    x = blocks.astype(np.uint64)
+    a = x.sum(axis=1)
+    b = x @ np.arange(L, 0, -1, dtype=np.uint64)
+    return ((a & 0xffff) | ((b & 0xffff) << 16)).astype(np.uint32)
+
+def rolling_weak(data, L, start, stop):
+    # Weak checksum of data[k:k+L] for every k in [start, stop), from two
+    # cumulative sums instead of one pass per offset. uint64 arithmetic wraps,
+    # which is exact modulo 2**16.
+    x = data[start:stop + L - 1].astype(np.uint64)
+    S = np.concatenate(([0], np.cumsum(x, dtype=np.uint64))).astype(np.uint64)
+    T = np.concatenate(([0], np.cumsum(x * np.arange(len(x), dtype=np.uint64), dtype=np.uint64))).astype(np.uint64)
+    j = np.arange(stop - start, dtype=np.uint64)
+    a = S[L:] - S[:-L]
+    b = (j + np.uint64(L)) * a - (T[L:] - T[:-L])
+    return ((a & 0xffff) | ((b & 0xffff) << 16)).astype(np.uint32)
+
+# ==== Subscriber side ====
+
+def file_signatures(path, block_size):
+    data = np.fromfile(path, dtype=np.uint8)
+    n = len(data) // block_size
+    blocks = data[:n * block_size].reshape(n, block_size)
+    weak = weak_checksums(blocks)
+    strong = np.array([strong_digest(block) for block in blocks], dtype="<u8")
+    return weak, strong
+
+def pack_signatures(base_hash, block_size, weak, strong):
+    buffer = io.BytesIO()
+    np.savez(buffer, weak=weak, strong=strong, block_size=block_size, base_hash=base_hash)
+    return buffer.getvalue()
+
+def apply_delta(base_path, delta, out_path):
+    # Rebuilds the target from `base_path` and `delta`. Returns the path of
+    # the result: `base_path` itself when every copy is at its own offset
+    # (e.g. the file only grew or changed at the tail), patched in place;
+    # otherwise `out_path`.
+    header, ops, literals = decode_delta(delta)
+    copies = ops[ops[:, 1] >= 0]
+    in_place = bool(np.all(copies[:, 0] == copies[:, 1]))
+    if in_place:
+        with open(base_path, "r+b") as f:
+            pos = 0
+            for dst, src, length in ops:
+                if src < 0:
+                    f.seek(dst)
+                    f.write(literals[pos:pos + length])
+                    pos += length
+            f.truncate(header["size"])
+        return base_path
+
+    with open(base_path, "rb") as f_src, open(out_path, "wb") as f_out:
+        pos = 0
+        for dst, src, length in ops:
+            if src < 0:
+                f_out.write(literals[pos:pos + length])
+                pos += length
+            else:
+                f_src.seek(src)
+                f_out.write(f_src.read(length))
+    return out_path
+
+# ==== Publisher side ====
+
+def request_signatures(session, relative_path, timeout=60.0, key_prefix="workdir"):
+    # (base_hash, block_size, weak, strong), or None if the subscriber has no copy
+    for reply in session.get(f"signatures/{key_prefix}/{relative_path}", timeout=timeout):
+        if reply.ok is None:
+            continue
+        payload = bytes(reply.ok.payload)
+        if not payload:
+            return None
+        sig = np.load(io.BytesIO(payload))
+        return str(sig["base_hash"]), int(sig["block_size"]), sig["weak"], sig["strong"]
+    return None
+
+def compute_delta(path, block_size, weak, strong):
+    # Returns (ops, literals): ops is an (m, 3) int64 array of
+    # (dst offset, src offset or -1 for literal bytes, length)
+    data = np.fromfile(path, dtype=np.uint8)
+    n = len(data)
+    L = block_size
+    blocks = {}
+    for index, key in enumerate(zip(weak.tolist(), strong.tolist())):
+        blocks.setdefault(key, index)
+    weak_set = np.unique(weak)
+
+    ops = []
+    literals = []
+    pos = 0  # everything before pos is covered by ops
+
+    def emit(dst, src, length):
+        if ops and src >= 0 and ops[-1][1] >= 0 and ops[-1][1] + ops[-1][2] == src and ops[-1][0] + ops[-1][2] == dst:
+            ops[-1][2] += length  # extend the previous copy
+        else:
+            ops.append([dst, src, length])
+
+    for seg_start in range(0, max(n - L + 1, 0), SEGMENT):
+        seg_stop = min(seg_start + SEGMENT, n - L + 1)
+        rolling = rolling_weak(data, L, seg_start, seg_stop)
+        hits = np.nonzero(np.isin(rolling, weak_set))[0]
+        for k, w in zip((hits + seg_start).tolist(), rolling[hits].tolist()):
+            if k < pos:
+                continue
+            index = blocks.get((w, strong_digest(data[k:k + L])))
+            if index is None:
+                continue
+            if k > pos:
+                emit(pos, -1, k - pos)
+                literals.append(data[pos:k].tobytes())
+            emit(k, index * L, L)
+            pos = k + L
+    if pos < n:
+        emit(pos, -1, n - pos)
+        literals.append(data[pos:].tobytes())
+    return np.array(ops, dtype=np.int64).reshape(-1, 3), b"".join(literals)
+
+def encode_delta(base_hash, target_hash, size, ops, literals):
+    header = json.dumps({"base": base_hash, "target": target_hash, "size": size, "ops": len(ops)}).encode()
+    return struct.pack("<Q", len(header)) + header + ops.tobytes() + literals
+
+def decode_delta(delta):
+    (header_len,) = struct.unpack_from("<Q", delta)
+    header = json.loads(delta[8:8 + header_len])
+    ops_end = 8 + header_len + 24 * header["ops"]
+    ops = np.frombuffer(delta[8 + header_len:ops_end], dtype=np.int64).reshape(-1, 3)
+    return header, ops, memoryview(delta)[ops_end:]
+
+def delta_header(delta):
+    return decode_delta(delta)[0]
@@ -1,6 +1,8 @@
 #!/bin/bash
 
 START_TIME=$SECONDS
+# Workdir as seen inside the container; subscribe_to_rpi.py passes each publisher's own
+WORKDIR=${1:-/storage/pv-hawk-tutorial/new_workdir}
 
 sudo docker run -it \
   --gpus all \
@@ -11,7 +13,7 @@ sudo docker run -it \
   --mount type=volume,dst=/pvextractor/extractor/mapping/OpenSfM \
   --mount type=bind,src=/home/ggeo/storage,dst=/storage \
   pv-hawk-custom-build_apel \
-  bash -c "python main.py /storage/pv-hawk-tutorial/new_workdir"
+  bash -c "python main.py $WORKDIR"
 
 ELAPSED_TIME=$(( SECONDS - START_TIME ))
 echo "=== Total time: $((ELAPSED_TIME / 60)) minutes and $((ELAPSED_TIME % 60)) seconds ==="
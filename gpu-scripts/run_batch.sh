@@ -0,0 +1,19 @@
+#!/bin/bash
+# Like run_app.sh, but without a terminal: started by subscribe_to_rpi.py --stream
+# for each frame batch after it has written the batch's config.yml into the workdir
+
+START_TIME=$SECONDS
+# Workdir as seen inside the container; subscribe_to_rpi.py passes each publisher's own
+WORKDIR=${1:-/storage/pv-hawk-tutorial/new_workdir}
+
+sudo docker run --rm \
+  --gpus all \
+  --ipc=host \
+  --mount type=bind,src="$(pwd)",dst=/pvextractor \
+  --mount type=volume,dst=/pvextractor/extractor/mapping/OpenSfM \
+  --mount type=bind,src=/home/ggeo/storage,dst=/storage \
+  pv-hawk-custom-build_apel \
+  bash -c "python main.py $WORKDIR"
+
+ELAPSED_TIME=$(( SECONDS - START_TIME ))
+echo "=== Batch time: $((ELAPSED_TIME / 60)) minutes and $((ELAPSED_TIME % 60)) seconds ==="
@@ -1,92 +1,679 @@
 import os
+import re
+import copy
+import json
+import queue
+import shutil
+import filecmp
+import argparse
 import subprocess
 import zenoh
-import subprocess
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import wire_codec
+import sync_manifest
+import delta_sync
+import tracing
+
+try:
+    import yaml
+except ImportError:
+    # Only needed for --stream
+    yaml = None
 
 DEST_BASE = "/home/ggeo/storage/pv-hawk-tutorial/new_workdir"
+# Publishers with an id put their keys under fleet/<id>/workdir/ and get their
+# own workdir FLEET_BASE/<id>; plain workdir/ keys are publisher "default"
+FLEET_BASE = "/home/ggeo/storage/pv-hawk-tutorial/fleet"
+DEFAULT_PUBLISHER = "default"
+HOST_STORAGE = "/home/ggeo/storage"  # mounted as /storage in the PV-Hawk containers
+CONTAINER_STORAGE = "/storage"
+CHUNK_SIZE = 128 * 1024  # offset of chunk N from publishers that do not send one
+FSYNC = True
+PVHAWK_DIR = "/home/ggeo/thesis/PV-Hawk"
+CONFIG_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yml")
+# Streaming mode: tasks that can run on a frame batch as soon as its frames are
+# in, and the inputs they need besides the frames. The remaining tasks run once
+# over the whole config after workdir/done.
+BATCH_TASKS = ["prepare_opensfm", "opensfm_extract_metadata", "opensfm_detect_features"]
+BATCH_INPUTS = ["splitted/gps/gps.json"]
+BATCH_DIR = "batches"  # per-batch workdirs, under the publisher's workdir
+FINAL_INPUTS = ["quadrilaterals/quadrilaterals.pkl", "tracking/tracks.csv"]
 
 def save_file(base_dir, relative_path, data):
+    # Written to a temp file and renamed, so a reader never sees a partial file
+    # and two retransmits of the same file cannot interleave
     dest_path = os.path.join(base_dir, relative_path)
     os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-    with open(dest_path, "wb") as f:
+    tmp_path = f"{dest_path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
         f.write(data)
+        if FSYNC:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, dest_path)
     print(f"[Subscriber] Saved file to {dest_path}")
 
 
-chunks_store = {}
-store_lock = threading.Lock()
+def read_chunk_record(chunks_path, version):
+    # Chunk IDs already written for `version` by an interrupted transfer
+    try:
+        with open(chunks_path) as f:
+            lines = f.read().split()
+    except FileNotFoundError:
+        return set()
+    if version is None or not lines or lines[0] != version:
+        return set()
+    return {int(line) for line in lines[1:]}
 
-def listener_factory(session):
-    def listener(sample):
-        key = str(sample.key_expr)
+class PartialFile:
+    # A chunked file being received. Chunks are written straight to their offset
+    # in <dest>.part, which is renamed over <dest> once every chunk is in, so
+    # memory use does not grow with the file size. The written chunk IDs are
+    # appended to <dest>.part.chunks under the file's content hash (`version`),
+    # so a transfer cut off partway resumes where it stopped.
+    def __init__(self, receiver, relative_path, version):
+        self.receiver = receiver
+        self.relative_path = relative_path
+        self.dest_path = os.path.join(receiver.dest_base, relative_path)
+        os.makedirs(os.path.dirname(self.dest_path), exist_ok=True)
+        self.part_path = self.dest_path + ".part"
+        self.chunks_path = self.part_path + ".chunks"
+        self.fd = None
+        self.generation = 0
+        self.writers = {}  # generation -> chunk writes in flight
+        self.log = None
+        received = read_chunk_record(self.chunks_path, version)
+        if received:
+            print(f"[Subscriber] Resuming {self.dest_path} with {len(received)} chunks on disk")
+        self.reset(version, received)
+
+    def reset(self, version, received=()):
+        # Called with the receiver's lock held
+        if self.fd is not None:
+            # Writes of the old version still in flight go to its unlinked .part
+            # (closed by the last of them), so they cannot clobber new chunks
+            os.remove(self.part_path)
+            if not self.writers.get(self.generation):
+                self.writers.pop(self.generation, None)
+                os.close(self.fd)
+        self.generation += 1
+        self.fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.version = version
+        self.size = None
+        self.received = set(received)
+        self.num_chunks = None
+        self.data_end = 0
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        if version is not None:
+            self.log = open(self.chunks_path, "a" if received else "w")
+            if not received:
+                self.log.write(f"{version}\n")
+                self.log.flush()
+
+    def allocate(self, total):
+        # Called with the receiver's lock held
+        if self.size is not None or total is None:
+            return
+        os.ftruncate(self.fd, total)
+        if total and hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(self.fd, 0, total)
+        self.size = total
+
+    def start_write(self):
+        # Called with the receiver's lock held; the chunk goes to the returned
+        # fd, which stays open until end_write()
+        self.writers[self.generation] = self.writers.get(self.generation, 0) + 1
+        return self.fd, self.generation
+
+    def end_write(self, fd, generation):
+        # Called with the receiver's lock held. False if the file was restarted
+        # with another version while the chunk was being written
+        self.writers[generation] -= 1
+        if generation == self.generation:
+            return True
+        if not self.writers[generation]:
+            del self.writers[generation]
+            os.close(fd)
+        return False
+
+    def record(self, chunk_id):
+        # Called with the receiver's lock held, after the chunk is written
+        self.received.add(chunk_id)
+        if self.log is not None:
+            self.log.write(f"{chunk_id}\n")
+            self.log.flush()
+
+    def complete(self):
+        return (not self.writers.get(self.generation) and self.num_chunks is not None
+                and all(i in self.received for i in range(self.num_chunks)))
+
+    def finalize(self):
+        # Returns False if the content does not match the announced hash
+        if self.size is None:
+            # Legacy publisher: size only known once all chunks are written
+            os.ftruncate(self.fd, self.data_end)
+        if FSYNC:
+            os.fsync(self.fd)
+        os.close(self.fd)
+        if self.log is not None:
+            self.log.close()
+
+        if self.version is not None and sync_manifest.digest_file(self.part_path) != self.version:
+            print(f"[Subscriber] Hash mismatch for {self.dest_path}, discarding it")
+            os.remove(self.part_path)
+            os.remove(self.chunks_path)
+            return False
+        os.replace(self.part_path, self.dest_path)
+        if self.version is not None:
+            os.remove(self.chunks_path)
+            if not self.relative_path.endswith(".delta"):
+                self.receiver.hash_cache.record(self.relative_path, self.version)
+        print(f"[Subscriber] Saved file to {self.dest_path} ({self.num_chunks} chunks)")
+        return True
+
+
+gpu_slots = threading.BoundedSemaphore(1)  # PV-Hawk containers running at once, set in main()
+
+def container_path(host_path):
+    return CONTAINER_STORAGE + host_path[len(HOST_STORAGE):]
 
-        if key == "workdir/done":
-            print("[Subscriber] Completion signal received! Starting processing script...")
-            subprocess.Popen(["bash", "/home/ggeo/thesis/PV-Hawk/run_app.sh"])
+def run_pvhawk(name, script, workdir):
+    # Blocks until a GPU slot is free and the job has finished
+    with gpu_slots:
+        print(f"[Subscriber] Starting PV-Hawk job: {name}")
+        with tracing.span("pvhawk", "subscribe", name) as job:
+            result = subprocess.run(["bash", os.path.join(PVHAWK_DIR, script), container_path(workdir)], cwd=PVHAWK_DIR)
+    print(f"[Subscriber] PV-Hawk job {name} finished in {job.seconds:.1f} s (exit {result.returncode})")
+    return result.returncode
+
+def merge_batch_output(batch_dir, workdir):
+    # Moves what a batch job wrote into its own workdir over to the publisher's.
+    # Per-frame outputs have distinct names. List files (*.txt) that every
+    # batch writes get the union of their lines; any other file written by
+    # several batches is kept from the first one, with a warning if they differ
+    prefixes = [(batch_dir + os.sep, workdir + os.sep),
+                (container_path(batch_dir) + "/", container_path(workdir) + "/")]
+    for root, dirs, files in os.walk(batch_dir):
+        rel = os.path.relpath(root, batch_dir)
+        if rel == ".":
+            # The linked inputs and the batch config
+            dirs[:] = [name for name in dirs if name != "splitted"]
+            files = [name for name in files if name != "config.yml"]
+        # Links to directories are moved like files
+        links = [name for name in dirs if os.path.islink(os.path.join(root, name))]
+        dirs[:] = [name for name in dirs if name not in links]
+        os.makedirs(os.path.normpath(os.path.join(workdir, rel)), exist_ok=True)
+        for name in files + links:
+            src = os.path.join(root, name)
+            dst = os.path.normpath(os.path.join(workdir, rel, name))
+            if os.path.lexists(dst):
+                if name.endswith(".txt"):
+                    with open(dst) as f:
+                        lines = f.read().splitlines()
+                    seen = set(lines)
+                    with open(src) as f:
+                        lines += [line for line in f.read().splitlines() if line not in seen]
+                    with open(dst, "w") as f:
+                        f.write("".join(line + "\n" for line in lines))
+                elif not filecmp.cmp(src, dst, shallow=False):
+                    print(f"[Subscriber] {dst} differs between batches, keeping the first")
+            elif os.path.islink(src):
+                # Absolute links into the batch workdir would break once it is removed
+                target = os.readlink(src)
+                for old, new in prefixes:
+                    if target.startswith(old):
+                        target = new + target[len(old):]
+                os.symlink(target, dst)
+            else:
+                os.replace(src, dst)
+    shutil.rmtree(batch_dir)
+
+def frame_index(relative_path):
+    match = re.match(r"splitted/radiometric/.*?(\d+)\.\w+$", relative_path)
+    return int(match.group(1)) if match else None
+
+class StreamScheduler:
+    # Streaming mode: instead of one run_app.sh after workdir/done, starts
+    # PV-Hawk on the BATCH_TASKS for each batch of `batch_size` frames as soon
+    # as those frames and the BATCH_INPUTS are in, while later frames are still
+    # arriving. Each batch job runs in its own workdir under BATCH_DIR, with
+    # splitted/ linked in and a config.yml whose cluster is narrowed to the
+    # batch's frame range, so no batch overwrites another's outputs; they are
+    # merged into the publisher's workdir when the job succeeds. After
+    # workdir/done the last job runs the remaining tasks over the full config
+    # there. A publisher's jobs run one at a time, in order.
+    def __init__(self, publisher_id, dest_base, config_path, batch_size):
+        with open(config_path) as f:
+            self.config = yaml.safe_load(f)
+        self.publisher_id = publisher_id
+        self.dest_base = dest_base
+        self.batch_size = batch_size
+        self.clusters = [(g, cluster) for g, group in enumerate(self.config["groups"])
+                         for cluster in group["clusters"]]
+        self.lock = threading.Lock()
+        self.reset()
+        self.jobs = queue.Queue()
+        threading.Thread(target=self._run_jobs, daemon=True).start()
+
+    def reset(self):
+        self.frames = set()
+        self.inputs = set()
+        # Per cluster, the first frame not yet handed to a batch job
+        self.next_frame = [cluster["frame_idx_start"] for _, cluster in self.clusters]
+
+    def on_file(self, relative_path):
+        index = frame_index(relative_path)
+        with self.lock:
+            if index is not None:
+                self.frames.add(index)
+            else:
+                self.inputs.add(relative_path)
+            self._schedule()
+
+    def _schedule(self, flush=False):
+        # Called with self.lock held; with `flush`, ranges with missing frames
+        # are scheduled too
+        if not all(path in self.inputs for path in BATCH_INPUTS):
             return
+        for i, (g, cluster) in enumerate(self.clusters):
+            while self.next_frame[i] < cluster["frame_idx_end"]:
+                start = self.next_frame[i]
+                stop = min(start + self.batch_size, cluster["frame_idx_end"])
+                if not flush and any(index not in self.frames for index in range(start, stop)):
+                    break
+                name = f"{self.publisher_id} batch cluster {cluster['cluster_idx']} frames {start}-{stop}"
+                batch_dir = os.path.join(self.dest_base, BATCH_DIR, f"cluster_{cluster['cluster_idx']}_{start}-{stop}")
+                self.jobs.put((name, self._batch_config(g, cluster, start, stop), batch_dir))
+                self.next_frame[i] = stop
+
+    def _batch_config(self, g, cluster, start, stop):
+        config = copy.deepcopy(self.config)
+        group = config["groups"][g]
+        group["clusters"] = [dict(cluster, frame_idx_start=start, frame_idx_end=stop)]
+        config["groups"] = [group]
+        config["tasks"] = [task for task in self.config["tasks"] if task in BATCH_TASKS]
+        return config
+
+    def finish(self):
+        with self.lock:
+            missing = [path for path in BATCH_INPUTS + FINAL_INPUTS if path not in self.inputs]
+            if missing:
+                print(f"[Subscriber] Completion signal from {self.publisher_id} without {', '.join(missing)}")
+            self.inputs.update(BATCH_INPUTS)
+            self._schedule(flush=True)
+            config = copy.deepcopy(self.config)
+            config["tasks"] = [task for task in self.config["tasks"] if task not in BATCH_TASKS]
+            self.jobs.put((f"{self.publisher_id} final", config, self.dest_base))
+            # Ready for the next transfer
+            self.reset()
+
+    def _run_jobs(self):
+        while True:
+            name, config, workdir = self.jobs.get()
+            if workdir != self.dest_base:
+                # Leftovers of an earlier run of the same batch
+                shutil.rmtree(workdir, ignore_errors=True)
+                os.makedirs(workdir)
+                os.symlink(os.path.relpath(os.path.join(self.dest_base, "splitted"), workdir),
+                           os.path.join(workdir, "splitted"))
+            with open(os.path.join(workdir, "config.yml"), "w") as f:
+                yaml.safe_dump(config, f, sort_keys=False)
+            if run_pvhawk(name, "run_batch.sh", workdir) != 0:
+                print(f"[Subscriber] Keeping {workdir} of failed job {name}")
+            elif workdir != self.dest_base:
+                merge_batch_output(workdir, self.dest_base)
+
+
+class Receiver:
+    # Transfer state of one publisher: its workdir, partially received files,
+    # hash cache and (in streaming mode) job scheduler. Publishers never share
+    # any of it, so several can send at full speed at the same time.
+    def __init__(self, publisher_id, dest_base, stream=None):
+        self.publisher_id = publisher_id
+        self.dest_base = dest_base
+        self.partial_files = {}
+        self.finished_versions = {}  # relative path -> content hash of the last completed transfer
+        self.lock = threading.Lock()
+        self.hash_cache = sync_manifest.HashCache(dest_base)
+        self.scheduler = None
+        if stream is not None:
+            config_path, batch_size = stream
+            self.scheduler = StreamScheduler(publisher_id, dest_base, config_path, batch_size)
+
+    def is_duplicate(self, original_file, version):
+        # Called with self.lock held. With several chunks in flight and ACKs that
+        # can be lost, a chunk or end marker may be resent after the file was
+        # already completed. Legacy publishers send no hash and are not checked.
+        return version is not None and self.finished_versions.get(original_file) == version
+
+    def partial_file(self, original_file, version):
+        # Called with self.lock held
+        state = self.partial_files.get(original_file)
+        if state is None:
+            state = self.partial_files[original_file] = PartialFile(self, original_file, version)
+        elif state.version != version:
+            # File changed on the publisher, drop whatever the old transfer left
+            print(f"[Subscriber] Restarting transfer of {state.dest_path}")
+            state.reset(version)
+        return state
+
+    def take_if_complete(self, original_file, state):
+        # Called with self.lock held; the caller finalizes outside the lock
+        if not state.complete():
+            return False
+        del self.partial_files[original_file]
+        self.finished_versions[original_file] = state.version
+        return True
+
+    def finalize(self, original_file, state):
+        if not state.finalize():
+            # Let the next manifest exchange send it again
+            with self.lock:
+                self.finished_versions.pop(original_file, None)
+        elif original_file.endswith(".delta"):
+            self.apply_received_delta(original_file[:-len(".delta")])
+        else:
+            self.file_complete(original_file)
 
-        relative_path = key[len("workdir/"):]
-        payload = bytes(sample.payload)
+    def apply_received_delta(self, relative_path):
+        # Runs before the last piece of the delta is ACKed, so the publisher's
+        # follow-up manifest check already sees the patched file
+        dest_path = os.path.join(self.dest_base, relative_path)
+        with open(dest_path + ".delta", "rb") as f:
+            delta = f.read()
+        os.remove(dest_path + ".delta")
 
+        header = delta_sync.delta_header(delta)
+        if self.hash_cache.digest(relative_path) != header["base"]:
+            print(f"[Subscriber] {dest_path} changed since its signatures were sent, ignoring delta")
+            return
+        out_path = delta_sync.apply_delta(dest_path, delta, dest_path + ".patched")
+        if sync_manifest.digest_file(out_path) != header["target"]:
+            # A file patched in place is broken now too; without it the next
+            # manifest check asks for the full file
+            print(f"[Subscriber] Patched {dest_path} does not match its hash, removing it")
+            os.remove(out_path)
+            return
+        if out_path != dest_path:
+            os.replace(out_path, dest_path)
+        self.hash_cache.record(relative_path, header["target"])
+        print(f"[Subscriber] Patched {dest_path} ({len(delta)} byte delta)")
+        self.file_complete(relative_path)
+
+    def on_chunk(self, base_file, chunk_id, meta, data):
+        version = meta.get("hash")
+        offset = int(meta.get("offset", chunk_id * CHUNK_SIZE))
+        with self.lock:
+            if self.is_duplicate(base_file, version):
+                return
+            state = self.partial_file(base_file, version)
+            state.allocate(int(meta["total"]) if "total" in meta else None)
+            fd, generation = state.start_write()
+        try:
+            os.pwrite(fd, data, offset)
+        except Exception:
+            with self.lock:
+                state.end_write(fd, generation)
+            raise
+        with self.lock:
+            if not state.end_write(fd, generation):
+                return
+            state.record(chunk_id)
+            state.data_end = max(state.data_end, offset + len(data))
+            done = self.take_if_complete(base_file, state)
+        if done:
+            self.finalize(base_file, state)
+        print(f"[Subscriber] Wrote chunk {chunk_id} of {state.dest_path}")
+
+    def on_end(self, original_file, meta, payload):
+        print(f"[Subscriber] Received end signal for {original_file} from {self.publisher_id}")
+        version = meta.get("hash")
+        num_chunks = int(payload[4:]) if payload.startswith(b"EOF ") else None
+        with self.lock:
+            if self.is_duplicate(original_file, version):
+                return
+            if num_chunks == 0:
+                self.finished_versions[original_file] = version
+                done = None
+            elif num_chunks is not None or original_file in self.partial_files:
+                # The end marker may overtake chunks that are still being resent,
+                # so the count is kept with the file's state until they are in
+                state = self.partial_file(original_file, version)
+                # After a restart no chunk may be left to carry the size
+                state.allocate(int(meta["total"]) if "total" in meta else None)
+                # Legacy stop-and-wait publisher sends a bare EOF after all chunks
+                state.num_chunks = num_chunks or len(state.received)
+                done = self.take_if_complete(original_file, state)
+            else:
+                # Bare EOF with nothing pending: a legacy stop-and-wait publisher
+                # resent the end marker of a completed file whose ACK was lost
+                print(f"[Subscriber] No chunks found for {original_file} on end signal")
+                return
+        if done is None:
+            save_file(self.dest_base, original_file, b"")
+            self.file_complete(original_file)
+        elif done:
+            self.finalize(original_file, state)
+
+    def save_verified(self, relative_path, meta, payload):
+        if "hash" in meta and sync_manifest.digest_bytes(payload) != meta["hash"]:
+            raise ValueError("content hash mismatch")
+        save_file(self.dest_base, relative_path, payload)
+        if "hash" in meta:
+            self.hash_cache.record(relative_path, meta["hash"])
+        self.file_complete(relative_path)
+
+    def handle_put(self, relative_path, meta, payload):
         if relative_path.startswith("splitted/"):
-            # Raw file, save immediately
-            save_file(DEST_BASE, relative_path, payload)
+            # Raw file, save immediately (a retransmit just rewrites it)
+            self.save_verified(relative_path, meta, payload)
 
         elif relative_path.endswith(".end"):
-            original_file = relative_path[:-4]  # remove '.end'
-            print(f"[Subscriber] Received end signal for {original_file}")
-
-            with store_lock:
-                if original_file in chunks_store:
-                    chunk_dict = chunks_store[original_file]
-                    ordered_chunks = [chunk_dict[i] for i in sorted(chunk_dict.keys())]
-                    full_data = b"".join(ordered_chunks)
-                    save_file(DEST_BASE, original_file, full_data)
-                    del chunks_store[original_file]
-                else:
-                    print(f"[Subscriber] No chunks found for {original_file} on end signal")
+            self.on_end(relative_path[:-4], meta, payload)  # remove '.end'
 
         elif ".chunk" in relative_path:
             base_file, chunk_part = relative_path.rsplit(".chunk", 1)
-            chunk_id = int(chunk_part)
-            with store_lock:
-                if base_file not in chunks_store:
-                    chunks_store[base_file] = {}
-                chunks_store[base_file][chunk_id] = payload
-            print(f"[Subscriber] Stored chunk {chunk_id} of {base_file}")
+            self.on_chunk(base_file, int(chunk_part), meta, payload)
 
         else:
             # If any other file (shouldn't happen in your case), just save raw
-            save_file(DEST_BASE, relative_path, payload)
+            self.save_verified(relative_path, meta, payload)
 
-        # Send ACK
-        ack_key = f"ack/{key}"
-        session.put(ack_key, b"ACK")
-        print(f"[Subscriber] Sent ACK for {ack_key}")
+    def file_complete(self, relative_path):
+        # A received file is fully on disk and verified
+        if self.scheduler is not None:
+            self.scheduler.on_file(relative_path)
+
+    def manifest_diff(self, manifest):
+        # {relative_path: [chunk ids already on disk]} for every file in the
+        # publisher's manifest that is missing here or has different content
+        outdated = sync_manifest.outdated_files(manifest, self.hash_cache)
+        for relative_path in manifest.keys() - set(outdated):
+            # Already here from an earlier transfer
+            self.file_complete(relative_path)
+        send = {}
+        with self.lock:
+            for relative_path in outdated:
+                version = manifest[relative_path]["hash"]
+                # Sent again even if an earlier transfer of this content completed
+                # (e.g. the file was deleted here since)
+                self.finished_versions.pop(relative_path, None)
+                state = self.partial_files.get(relative_path)
+                if state is not None and state.version == version:
+                    have = state.received
+                else:
+                    have = read_chunk_record(os.path.join(self.dest_base, relative_path) + ".part.chunks", version)
+                send[relative_path] = sorted(have)
+        return send
+
+    def signatures(self, relative_path):
+        # Packed block signatures of our copy of a file, b"" if we have none
+        base_hash = self.hash_cache.digest(relative_path)
+        if base_hash is None:
+            return b""
+        dest_path = os.path.join(self.dest_base, relative_path)
+        block_size = delta_sync.block_size_for(os.path.getsize(dest_path))
+        weak, strong = delta_sync.file_signatures(dest_path, block_size)
+        print(f"[Subscriber] Sending {len(weak)} block signatures for {dest_path}")
+        return delta_sync.pack_signatures(base_hash, block_size, weak, strong)
+
+    def on_done(self):
+        # Every file was ACKed before this is sent, so all writes are done
+        self.hash_cache.save()
+        if self.scheduler is not None:
+            print(f"[Subscriber] Completion signal from {self.publisher_id}! Queueing final PV-Hawk job...")
+            self.scheduler.finish()
+            return
+        print(f"[Subscriber] Completion signal from {self.publisher_id}! Starting processing script...")
+        threading.Thread(target=run_pvhawk, args=(f"{self.publisher_id} full run", "run_app.sh", self.dest_base),
+                         daemon=True).start()
+
+
+receivers = {}
+receivers_lock = threading.Lock()
+stream_config = None  # (config path, batch size) with --stream, set in main()
+
+def get_receiver(publisher_id):
+    with receivers_lock:
+        if publisher_id not in receivers:
+            if publisher_id == DEFAULT_PUBLISHER:
+                dest_base = DEST_BASE
+            else:
+                dest_base = os.path.join(FLEET_BASE, publisher_id)
+                print(f"[Subscriber] New publisher {publisher_id}, writing to {dest_base}")
+            receivers[publisher_id] = Receiver(publisher_id, dest_base, stream_config)
+        return receivers[publisher_id]
+
+def split_key(key):
+    # "workdir/<rest>" -> ("default", "workdir", rest),
+    # "fleet/<id>/workdir/<rest>" -> (id, "fleet/<id>/workdir", rest);
+    # None for anything else, including ids that are not safe as a directory name
+    parts = key.split("/", 3)
+    if parts[0] == "workdir":
+        return DEFAULT_PUBLISHER, "workdir", key[len("workdir/"):]
+    if len(parts) >= 3 and parts[0] == "fleet" and parts[2] == "workdir" and re.fullmatch(r"[\w-]+", parts[1]):
+        return parts[1], "/".join(parts[:3]), parts[3] if len(parts) > 3 else ""
+    return None
+
+def handle_put(session, receiver, key, relative_path, payload, attachment, queued_ns):
+    # Runs on the I/O pool; the ACK goes out only once the data is on disk
+    tracing.add("io_queue", "subscribe", queued_ns, time.perf_counter_ns(), relative_path)
+    try:
+        with tracing.span("decode", "subscribe", relative_path):
+            meta = wire_codec.parse_attachment(attachment)
+            payload = wire_codec.decode(payload, meta)
+        with tracing.span("write", "subscribe", relative_path):
+            receiver.handle_put(relative_path, meta, payload)
+    except Exception as e:
+        # Not ACKed, so the publisher resends it
+        print(f"[Subscriber] Failed to handle {key}: {e}")
+        return
+
+    # Send ACK (one per key, duplicates are ACKed again)
+    ack_key = f"ack/{key}"
+    session.put(ack_key, b"ACK")
+    print(f"[Subscriber] Sent ACK for {ack_key}")
+
+def listener_factory(session, io_pool):
+    # The zenoh callback only copies the sample out and queues it, so slow disk
+    # writes do not hold up delivery of other keys
+    def listener(sample):
+        key = str(sample.key_expr)
+        parsed = split_key(key)
+        if parsed is None:
+            print(f"[Subscriber] Ignoring {key}")
+            return
+        publisher_id, _, relative_path = parsed
+        receiver = get_receiver(publisher_id)
+
+        if relative_path == "done":
+            receiver.on_done()
+            return
+
+        attachment = bytes(sample.attachment) if sample.attachment is not None else None
+        io_pool.submit(handle_put, session, receiver, key, relative_path, bytes(sample.payload), attachment,
+                       time.perf_counter_ns())
 
     return listener
 
+def declare_manifest_queryable(session):
+    def on_query(query):
+        key = str(query.key_expr)
+        parsed = split_key(key[len("manifest/"):])
+        if parsed is None:
+            return
+        receiver = get_receiver(parsed[0])
+        manifest = json.loads(bytes(query.payload))
+        with tracing.span("manifest_diff", "subscribe", receiver.publisher_id):
+            send = receiver.manifest_diff(manifest)
+        print(f"[Subscriber] Manifest from {receiver.publisher_id}: {len(manifest)} files, {len(send)} missing or outdated")
+        query.reply(key, json.dumps({"send": send}).encode())
+
+    return session.declare_queryable("manifest/**", on_query)
+
+def declare_signatures_queryable(session):
+    def on_query(query):
+        key = str(query.key_expr)
+        parsed = split_key(key[len("signatures/"):])
+        if parsed is None:
+            return
+        publisher_id, _, relative_path = parsed
+        query.reply(key, get_receiver(publisher_id).signatures(relative_path))
+
+    return session.declare_queryable("signatures/**", on_query)
+
 
 
 def main():
+    global FSYNC, stream_config, gpu_slots
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--io-workers", type=int, default=4, help="Threads writing received files to disk")
+    parser.add_argument("--no-fsync", action="store_true", help="Do not fsync files before renaming them into place")
+    parser.add_argument("--stream", action="store_true", help="Start PV-Hawk on frame batches as they arrive instead of after workdir/done")
+    parser.add_argument("--batch-size", type=int, default=100, help="Frames per streaming batch job")
+    parser.add_argument("--config", default=CONFIG_TEMPLATE, help="PV-Hawk config the streaming batch configs are derived from")
+    parser.add_argument("--max-jobs", type=int, default=1, help="PV-Hawk jobs (across all publishers) allowed to run at once")
+    parser.add_argument("--trace", metavar="CSV", help="Record receive/write/PV-Hawk spans to this CSV (and a Chrome trace .json next to it)")
+    args = parser.parse_args()
+    FSYNC = not args.no_fsync
+    gpu_slots = threading.BoundedSemaphore(args.max_jobs)
+    if args.stream:
+        if yaml is None:
+            parser.error("--stream needs PyYAML (pip install pyyaml)")
+        stream_config = (args.config, args.batch_size)
+
     conf = zenoh.Config()
     # conf.insert_json5("connect/endpoints", '["tcp:<RPI_IP>:7447"]')
 
     print("[Subscriber] Connecting to Zenoh...")
     session = zenoh.open(conf)
+    io_pool = ThreadPoolExecutor(max_workers=args.io_workers)
+    if args.trace:
+        tracing.start(args.trace, "subscriber")
 
     try:
-        print("[Subscriber] Subscribing to workdir/**")
-        session.declare_subscriber("workdir/**", listener_factory(session))
+        print("[Subscriber] Subscribing to workdir/** and fleet/*/workdir/**")
+        listener = listener_factory(session, io_pool)
+        session.declare_subscriber("workdir/**", listener)
+        session.declare_subscriber("fleet/*/workdir/**", listener)
+        wire_codec.declare_codecs_queryable(session)
+        declare_manifest_queryable(session)
+        declare_signatures_queryable(session)
+        print(f"[Subscriber] Accepting codecs: {', '.join(wire_codec.DECOMPRESSORS)}")
         print("[Subscriber] Ready to receive files. Press Ctrl+C to stop.")
-        import time
         while True:
             time.sleep(1)
+            tracing.flush()
     except KeyboardInterrupt:
         print("\n[Subscriber] Stopping...")
     finally:
+        io_pool.shutdown()
         session.close()
+        tracing.stop()
 
 if __name__ == "__main__":
     main()
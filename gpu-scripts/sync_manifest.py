@@ -0,0 +1,100 @@
+import os
+import json
+import hashlib
+import threading
+
+# Content-hash manifest for incremental publisher/subscriber syncs.
+# Shared by rpi-scripts and gpu-scripts, keep both copies identical.
+#
+# The publisher sends {relative_path: {"size", "hash"}} as the payload of a
+# get on manifest/<key prefix>. The subscriber replies {"send": {relative_path:
+# [chunk ids it already has]}} listing only the files it is missing or has
+# out of date; files that are not listed are skipped.
+CACHE_NAME = ".sync_hashes.json"
+
+def digest_bytes(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def digest_file(path, block_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+class HashCache:
+    # File digests under `root` keyed by (size, mtime_ns), so unchanged files
+    # are not read again on every sync. Persisted as root/.sync_hashes.json.
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, CACHE_NAME)
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def digest(self, relative_path):
+        # None if the file does not exist
+        full_path = os.path.join(self.root, relative_path)
+        try:
+            st = os.stat(full_path)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            entry = self.entries.get(relative_path)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        digest = digest_file(full_path)
+        self.record(relative_path, digest, st)
+        return digest
+
+    def record(self, relative_path, digest, st=None):
+        if st is None:
+            st = os.stat(os.path.join(self.root, relative_path))
+        with self.lock:
+            self.entries[relative_path] = [st.st_size, st.st_mtime_ns, digest]
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.entries)
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+def build_manifest(relative_paths, cache):
+    manifest = {}
+    for relative_path in relative_paths:
+        size = os.path.getsize(os.path.join(cache.root, relative_path))
+        manifest[relative_path] = {"size": size, "hash": cache.digest(relative_path)}
+    cache.save()
+    return manifest
+
+def outdated_files(manifest, cache):
+    # Paths in `manifest` whose local copy is missing or has different content
+    outdated = []
+    for relative_path, entry in manifest.items():
+        full_path = os.path.join(cache.root, relative_path)
+        if not os.path.exists(full_path) or os.path.getsize(full_path) != entry["size"]:
+            outdated.append(relative_path)
+        elif cache.digest(relative_path) != entry["hash"]:
+            outdated.append(relative_path)
+    cache.save()
+    return outdated
+
+# ==== Publisher side ====
+
+def request_sync(session, manifest, timeout=60.0, key_prefix="workdir"):
+    # Returns {relative_path: set(chunk ids already received)} for the files
+    # to send, or None if no subscriber answered (send everything)
+    for reply in session.get(f"manifest/{key_prefix}", payload=json.dumps(manifest).encode(), timeout=timeout):
+        if reply.ok is not None:
+            send = json.loads(bytes(reply.ok.payload))["send"]
+            return {path: set(chunks) for path, chunks in send.items()}
+    return None
@@ -0,0 +1,168 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+
+# Low-overhead timing spans for the whole pipeline (inference, publisher,
+# subscriber). Shared by rpi-scripts and gpu-scripts, keep both copies identical.
+#
+# A span is timed with time.perf_counter_ns() whether tracing is on or not, so
+# callers use span.seconds instead of their own time.time() pairs. With a
+# tracer started, finished spans are appended to an in-memory list and written
+# to one CSV every `flush_every` spans (the file stays open for the run). The
+# list is only touched under _lock; the CSV is written under _write_lock, so
+# adding spans never waits for the disk.
+# Timestamps are stored as wall-clock ns so CSVs from several processes or
+# hosts can be merged into one Chrome/Perfetto trace:
+#
+#   python tracing.py rpi_trace.csv gpu_trace.csv -o trace.json
+
+FIELDS = ["ts_ns", "dur_ns", "name", "cat", "process", "pid", "tid", "frame"]
+
+class Span:
+    __slots__ = ("tracer", "name", "cat", "frame", "start_ns", "end_ns")
+
+    def __init__(self, tracer, name, cat, frame):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.frame = frame
+        self.start_ns = self.end_ns = 0
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.end_ns = time.perf_counter_ns()
+        if self.tracer is not None:
+            self.tracer.add(self.name, self.cat, self.start_ns, self.end_ns, self.frame)
+        return False
+
+    @property
+    def seconds(self):
+        return (self.end_ns - self.start_ns) / 1e9
+
+class Tracer:
+    # Safe to call from several threads
+    def __init__(self, path, process_name=None, flush_every=1024):
+        self.path = path
+        self.process_name = process_name or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+        self.flush_every = flush_every
+        self.pid = os.getpid()
+        # perf_counter_ns has an arbitrary epoch; this maps it onto time.time_ns()
+        self.epoch_offset_ns = time.time_ns() - time.perf_counter_ns()
+        self._spans = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(FIELDS)
+
+    def span(self, name, cat="", frame=""):
+        return Span(self, name, cat, frame)
+
+    def add(self, name, cat, start_ns, end_ns, frame=""):
+        # For intervals measured elsewhere, on the perf_counter_ns clock
+        span = (start_ns, end_ns - start_ns, name, cat, threading.get_native_id(), frame)
+        with self._lock:
+            self._spans.append(span)
+            full = len(self._spans) >= self.flush_every
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                spans, self._spans = self._spans, []
+            if spans:
+                offset = self.epoch_offset_ns
+                self._writer.writerows((start + offset, dur, name, cat, self.process_name, self.pid, tid, frame)
+                                       for start, dur, name, cat, tid, frame in spans)
+                self._file.flush()
+
+    def close(self, chrome_path=None):
+        self.flush()
+        self._file.close()
+        if chrome_path:
+            export_chrome([self.path], chrome_path)
+
+class NullTracer:
+    # Drop-in when tracing is off: spans are still timed, nothing is recorded
+    def span(self, name, cat="", frame=""):
+        return Span(None, name, cat, frame)
+
+    def add(self, name, cat, start_ns, end_ns, frame=""):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self, chrome_path=None):
+        pass
+
+# Process-wide tracer, so modules can add spans without passing it around
+_tracer = NullTracer()
+
+def start(path, process_name=None, flush_every=1024):
+    global _tracer
+    _tracer.close()
+    _tracer = Tracer(path, process_name, flush_every)
+    return _tracer
+
+def stop(chrome=True):
+    # Flush the CSV and, by default, write <path>.json next to it
+    global _tracer
+    tracer, _tracer = _tracer, NullTracer()
+    if isinstance(tracer, Tracer):
+        tracer.close(os.path.splitext(tracer.path)[0] + ".json" if chrome else None)
+        print(f"[INFO] Trace written to {tracer.path}")
+
+def span(name, cat="", frame=""):
+    return _tracer.span(name, cat, frame)
+
+def add(name, cat, start_ns, end_ns, frame=""):
+    _tracer.add(name, cat, start_ns, end_ns, frame)
+
+def flush():
+    # Long-running processes call this when idle so the CSV stays current
+    _tracer.flush()
+
+def export_chrome(csv_paths, out_path):
+    # Chrome trace event format ("X" complete events, µs), opens in
+    # chrome://tracing and ui.perfetto.dev
+    events = []
+    processes = {}
+    for path in csv_paths:
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                pid = int(row["pid"])
+                processes[pid] = row["process"]
+                event = {
+                    "name": row["name"],
+                    "cat": row["cat"],
+                    "ph": "X",
+                    "ts": int(row["ts_ns"]) / 1000,
+                    "dur": int(row["dur_ns"]) / 1000,
+                    "pid": pid,
+                    "tid": int(row["tid"]),
+                }
+                if row["frame"]:
+                    event["args"] = {"frame": row["frame"]}
+                events.append(event)
+    for pid, name in processes.items():
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}})
+    with open(out_path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge trace CSVs into one Chrome/Perfetto trace")
+    parser.add_argument("csv", nargs="+", help="Trace CSVs written with --trace")
+    parser.add_argument("-o", "--output", default="trace.json")
+    args = parser.parse_args()
+    export_chrome(args.csv, args.output)
+    print(f"[INFO] {len(args.csv)} trace(s) merged into {args.output}")
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+# Chunked idle-baseline estimation for long power captures.
+#
+# trend:    centered rolling median over `window` samples. Chunks are stitched
+#           with `window // 2` samples of context on each side, so the result
+#           equals a whole-series rolling median while only one chunk (plus
+#           context) is in memory.
+# seasonal: running mean of (value - trend) per phase (sample index mod
+#           `period`), centered to zero mean, updated as chunks stream through.
+# level:    running mean of the trend, i.e. the idle power to subtract from a
+#           full-load capture.
+
+class StreamingBaseline:
+    def __init__(self, window=301, period=7):
+        self.window = window
+        self.half = window // 2
+        self.period = period
+        self.ctx_t = np.zeros(0)
+        self.ctx_v = np.zeros(0)
+        self.pend_t = np.zeros(0)
+        self.pend_v = np.zeros(0)
+        self.emitted = 0
+        self.seasonal_sum = np.zeros(period)
+        self.seasonal_count = np.zeros(period)
+        self.trend_sum = 0.0
+
+    def _emit(self, buf_t, buf_v, start, stop):
+        trend = pd.Series(buf_v).rolling(self.window, center=True, min_periods=1).median().to_numpy()
+        t, v, trend = buf_t[start:stop], buf_v[start:stop], trend[start:stop]
+
+        phase = (self.emitted + np.arange(len(v))) % self.period
+        np.add.at(self.seasonal_sum, phase, v - trend)
+        np.add.at(self.seasonal_count, phase, 1)
+        seasonal = self.seasonal_profile()[phase]
+
+        self.emitted += len(v)
+        self.trend_sum += trend.sum()
+        return pd.DataFrame({"Time_s": t, "Power_W": v, "Trend": trend, "Seasonal": seasonal,
+                             "Denoised": trend + seasonal})
+
+    def update(self, time_s, power_w):
+        # Feed the next chunk; returns the samples whose window is now complete
+        buf_t = np.concatenate([self.ctx_t, self.pend_t, np.asarray(time_s, dtype=np.float64)])
+        buf_v = np.concatenate([self.ctx_v, self.pend_v, np.asarray(power_w, dtype=np.float64)])
+        start = len(self.ctx_v)
+        stop = max(start, len(buf_v) - self.half)
+
+        out = self._emit(buf_t, buf_v, start, stop)
+        self.ctx_t, self.ctx_v = buf_t[max(0, stop - self.half):stop], buf_v[max(0, stop - self.half):stop]
+        self.pend_t, self.pend_v = buf_t[stop:], buf_v[stop:]
+        return out
+
+    def finish(self):
+        # Flush the last samples (window truncated at the end, as in the whole-series median)
+        buf_t = np.concatenate([self.ctx_t, self.pend_t])
+        buf_v = np.concatenate([self.ctx_v, self.pend_v])
+        out = self._emit(buf_t, buf_v, len(self.ctx_v), len(buf_v))
+        self.pend_t, self.pend_v = np.zeros(0), np.zeros(0)
+        return out
+
+    def seasonal_profile(self):
+        # Zero-mean over one period, so it only redistributes power within a cycle
+        profile = np.divide(self.seasonal_sum, self.seasonal_count,
+                            out=np.zeros(self.period), where=self.seasonal_count > 0)
+        return profile - profile.mean()
+
+    def level(self):
+        return self.trend_sum / self.emitted if self.emitted else 0.0
+
+def read_power_chunks(csv_path, chunksize):
+    # Captures are two columns (time, power) with varying header names
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        yield chunk.iloc[:, 0].to_numpy(), chunk.iloc[:, 1].to_numpy()
+
+def denoise_csv(in_path, out_path, window=301, period=7, chunksize=1_000_000, on_chunk=None):
+    # Write Time_s,Denoised for a whole capture; returns the fitted estimator
+    estimator = StreamingBaseline(window, period)
+
+    def parts():
+        for time_s, power_w in read_power_chunks(in_path, chunksize):
+            yield estimator.update(time_s, power_w)
+        yield estimator.finish()
+
+    header = True
+    with open(out_path, "w", newline="") as out:
+        for part in parts():
+            part[["Time_s", "Denoised"]].to_csv(out, index=False, header=header)
+            header = False
+            if on_chunk is not None:
+                on_chunk(part)
+    return estimator
+
+def subtract_baseline_csv(in_path, out_path, level, seasonal=None, chunksize=1_000_000):
+    # Write Time_s,Inference_Only = full-load power - idle baseline
+    header = True
+    index = 0
+    with open(out_path, "w", newline="") as out:
+        for time_s, power_w in read_power_chunks(in_path, chunksize):
+            baseline = level
+            if seasonal is not None:
+                baseline = level + seasonal[(index + np.arange(len(power_w))) % len(seasonal)]
+            index += len(power_w)
+            pd.DataFrame({"Time_s": time_s, "Inference_Only": power_w - baseline}).to_csv(out, index=False, header=header)
+            header = False
@@ -1,64 +1,84 @@
+import argparse
 import pandas as pd
 import matplotlib.pyplot as plt
 
 import seaborn as sns
 import numpy as np
-
-# Load power samples
-df = pd.read_csv("isolated_inference_power_full.csv")
-
-
-# Load inference durations
-meta_df = pd.read_csv("per_frame_log_full.csv")
-meta_df["inference_id"] = meta_df["Tag"].str.extract("(\d+)").astype(int) -1  # zero-indexed
+from capture_logs import load_power_samples, load_stage_intervals
+from energy import attribute_energy, summarize
+
+parser = argparse.ArgumentParser(description="Energy per inference from power samples and inference timings")
+parser.add_argument("--events", help="Stage marker log from inference_yolo.py --event-log (exact per-frame intervals)")
+parser.add_argument("--power-log", help="Binary power log from power_sampler.py (used with --events)")
+parser.add_argument("--idle-power", type=float, default=0.0, help="Idle power (W) subtracted from --power-log samples")
+args = parser.parse_args()
+if args.events and not args.power_log:
+    parser.error("--events needs --power-log (the power samples on the same clock)")
+
+if args.events:
+    # Power samples and stage markers share the Pi's monotonic clock,
+    # so every inference gets its exact [start, end) window
+    power = load_power_samples(args.power_log)
+    t0_ns = power["t_ns"].iloc[0]
+    df = pd.DataFrame({
+        "Time_s": (power["t_ns"] - t0_ns) / 1e9,
+        "Inference_Only": power["power_w"] - args.idle_power,
+    })
+
+    stage_intervals = load_stage_intervals(args.events)
+    stage_intervals["inference_id"] = stage_intervals["frame"]
+    stage_intervals["start"] = (stage_intervals["start_ns"] - t0_ns) / 1e9
+    stage_intervals["end"] = (stage_intervals["end_ns"] - t0_ns) / 1e9
+    intervals = stage_intervals[stage_intervals["stage"] == "inf"]
+    # Frames skipped by the frame gate (inference_yolo.py --skip-threshold) have pre/post but no inf interval
+    num_frames = stage_intervals["frame"].nunique()
+    if len(intervals) < num_frames:
+        print(f"Frames: {num_frames}, inferred: {len(intervals)} ({num_frames - len(intervals)} skipped by the frame gate)")
+else:
+    stage_intervals = None
+    num_frames = None
+
+    # Load power samples
+    df = pd.read_csv("isolated_inference_power_full.csv")
+
+    # Load inference durations
+    meta_df = pd.read_csv("per_frame_log_full.csv")
+    meta_df["inference_id"] = meta_df["Tag"].str.extract("(\d+)").astype(int) -1  # zero-indexed
+    meta_df = meta_df.sort_values("inference_id").reset_index(drop=True)
+
+    # No markers: lay the inferences back to back from the first sample
+    start_time = df["Time_s"].min()
+    end_times = start_time + meta_df["InferenceTime(s)"].cumsum()
+    intervals = pd.DataFrame({
+        "inference_id": meta_df["inference_id"],
+        "start": end_times - meta_df["InferenceTime(s)"],
+        "end": end_times,
+    })
 
 # Sort data to ensure it's chronological
 df = df.sort_values("Time_s").reset_index(drop=True)
-meta_df = meta_df.sort_values("inference_id").reset_index(drop=True)
-
-# Now assign inference IDs based on cumulative duration
-start_time = df["Time_s"].iloc[0]
-current_time = start_time
-df["inference_id"] = -1  # Initialize all samples as unassigned
-row_idx = 0
-
-for i, row in meta_df.iterrows():
-    duration = row["InferenceTime(s)"]
-    end_time = current_time + duration
-    
-    # Assign samples within current time window to current inference_id
-    mask = (df["Time_s"] >= current_time) & (df["Time_s"] < end_time)
-    df.loc[mask, "inference_id"] = row["inference_id"]
-    
-    current_time = end_time
-
-# Drop unassigned rows (if any)
-df = df[df["inference_id"] != -1]
-
-durations = meta_df.set_index("inference_id")["InferenceTime(s)"]
-
+intervals = intervals.sort_values("inference_id").reset_index(drop=True)
 
-def compute_energy(group):
-    inf_id = int(group.name)
-    duration = durations.get(inf_id, 0.0)
 
-    if len(group) == 0 or duration == 0.0:
-        return pd.Series({"Mean_Power": 0.0, "Energy": 0.0})
+# Trapezoidal energy of every inference window in one vectorized pass (see energy.py)
+time_s = df["Time_s"].to_numpy()
+power_w = df["Inference_Only"].to_numpy()
+results = attribute_energy(time_s, power_w, intervals["start"], intervals["end"], intervals["inference_id"])
+summary = summarize(results)
 
-    # Set negative values to 0 before squaring
-    mean_power = group["Inference_Only"].clip(lower=0).mean()
-
-    energy = mean_power * duration
-    return pd.Series({"Mean_Power": mean_power, "Energy": energy})
-
-
-
-results = df.groupby("inference_id").apply(compute_energy).reset_index()
+if stage_intervals is not None:
+    for stage, group in stage_intervals.groupby("stage"):
+        stage_results = attribute_energy(time_s, power_w, group["start"], group["end"], group["inference_id"])
+        print(f"Stage {stage}: mean duration {stage_results['Duration'].mean():.6f} s, "
+              f"mean energy {stage_results['Energy'].mean():.6f} J")
 
 
 # Mean energy
 mean_energy_all = results["Energy"].mean()
 print("Mean energy per inference (overall):", mean_energy_all)
+if num_frames:
+    # What a flight costs per captured frame, with or without the frame gate
+    print("Inference energy per frame:", results["Energy"].sum() / num_frames)
 
 # Plotting
 plt.figure(figsize=(10, 5))
@@ -96,26 +116,24 @@ plt.show()
 # === Metrics Calculation ===
 
 # Overall mean power per inference (mean of means)
-overall_mean_power = results["Mean_Power"].mean()
+overall_mean_power = summary["mean_power"]
 
 # Mean Absolute Deviation (MEAD) of Power per Inference
-mead_power = (results["Mean_Power"] - overall_mean_power).abs().mean()
+mead_power = summary["mead_power"]
 print(f"MEAD Power/Inference (W): {mead_power:.4f}")
 
 
 # Stdev of power per inference
-std_power = results["Mean_Power"].std()
+std_power = summary["std_power"]
 
 # Mean inference duration
-mean_duration = durations.mean()
+mean_duration = summary["mean_duration"]
 
 # Performance: inferences per second (total inferences / total time)
-total_time = durations.sum()
-performance_inf_per_s = len(durations) / total_time if total_time > 0 else 0.0
+performance_inf_per_s = summary["performance"]
 
-# Efficiency: performance per watt
-mean_power_total = df["Inference_Only"].clip(lower=0).mean()
-efficiency_perf_per_watt = performance_inf_per_s / mean_power_total if mean_power_total > 0 else 0.0
+# Efficiency: performance per watt (time-weighted mean power over all inference windows)
+efficiency_perf_per_watt = summary["efficiency"]
 
 # === Print results ===
 print(f"Overall Mean Power/Inference (W): {overall_mean_power:.4f}")
@@ -124,6 +142,3 @@ print(f"Mean Inference Duration (s): {mean_duration:.6f}")
 print(f"Mean Energy Consumption/Inference (J): {mean_energy_all:.6f}")
 print(f"Performance (inferences/s): {performance_inf_per_s:.4f}")
 print(f"Efficiency (Perf per Watt): {efficiency_perf_per_watt:.4f}")
-
-
-
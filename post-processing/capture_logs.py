@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+# Readers for the binary logs written on the Pi by rpi-scripts/power_sampler.py
+# and rpi-scripts/event_log.py. Both are stamped with time.monotonic_ns() on the
+# same machine, so their timestamps can be compared directly.
+POWER_DTYPE = np.dtype([
+    ("t_ns", "<i8"),
+    ("bus_v", "<f4"),
+    ("current_ma", "<f4"),
+    ("power_w", "<f4"),
+])
+EVENT_DTYPE = np.dtype([
+    ("t_ns", "<i8"),
+    ("frame", "<i4"),
+    ("stage", "u1"),
+    ("kind", "u1"),
+])
+STAGES = ["pre", "inf", "post"]
+START, END = 0, 1
+
+def load_power_samples(path):
+    return pd.DataFrame(np.fromfile(path, dtype=POWER_DTYPE))
+
+def load_stage_intervals(path):
+    # One row per (frame, stage): start_ns, end_ns. Unpaired markers (e.g. a run
+    # that was killed mid-frame) are dropped.
+    events = pd.DataFrame(np.fromfile(path, dtype=EVENT_DTYPE))
+    intervals = events.pivot_table(index=["frame", "stage"], columns="kind", values="t_ns", aggfunc="first")
+    intervals = intervals.rename(columns={START: "start_ns", END: "end_ns"}).dropna().reset_index()
+    intervals["stage"] = intervals["stage"].map(dict(enumerate(STAGES)))
+    intervals[["start_ns", "end_ns"]] = intervals[["start_ns", "end_ns"]].astype(np.int64)
+    intervals.columns.name = None
+    return intervals.sort_values("start_ns").reset_index(drop=True)
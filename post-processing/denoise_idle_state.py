@@ -1,50 +1,57 @@
+import argparse
 import pandas as pd
-import matplotlib.pyplot as plt
-from statsmodels.tsa.seasonal import STL
-
-# === Load the CSV ===
-df = pd.read_csv('idle_1ms.csv')
-
-# Rename for easier access
-df.columns = ['Time_s', 'Power_W']
-
-# === Ensure it's sorted by time ===
-df = df.sort_values('Time_s').reset_index(drop=True)
-
-series = df['Power_W']
-
-
-# ===  Apply STL decomposition ===
-stl = STL(series, period= 7)  # Adjust `period` as needed
-result = stl.fit()
-
-df.plot(x='Time_s', y='Power_W', title='Power Over Time')
-plt.xlabel('Time (s)')
-plt.ylabel('Power (W)')
-plt.show()
-
-
-
-# === 5. Plot the components ===
-result.plot()
-plt.suptitle('STL Seasonal Decomposition of Power Data', fontsize=14)
-plt.tight_layout()
-plt.show()
-
-cleaned = result.trend + result.seasonal
-
-plt.figure(figsize=(12, 5))
-plt.plot(df['Time_s'], series, label='Original', alpha=0.5)
-plt.plot(df['Time_s'], cleaned, label='Denoised (Trend + Seasonal)', linewidth=2)
-plt.xlabel('Time (s)')
-plt.ylabel('Power (W)')
-plt.title('Original vs Denoised Power')
-plt.legend()
-plt.show()
-
-df['Denoised'] = result.trend + result.seasonal
-# Create a new DataFrame with just Time and Denoised Power
-denoised_df = df[['Time_s', 'Denoised']]
-
-# Save to CSV
-denoised_df.to_csv('denoised_power_idle_1ms.csv', index=False)
+from baseline import denoise_csv, subtract_baseline_csv
+
+parser = argparse.ArgumentParser(description="Estimate the idle power baseline in bounded memory and (optionally) "
+                                             "subtract it from a full-load capture")
+parser.add_argument("--idle", default="idle_1ms.csv", help="Idle capture (time, power)")
+parser.add_argument("--out", default="denoised_power_idle_1ms.csv", help="Denoised idle output (Time_s, Denoised)")
+parser.add_argument("--full-load", help="Full-load capture to isolate inference power from")
+parser.add_argument("--isolated-out", default="isolated_inference_power_full.csv",
+                    help="Output for --full-load (Time_s, Inference_Only)")
+parser.add_argument("--window", type=int, default=301, help="Rolling median window for the trend (samples)")
+parser.add_argument("--period", type=int, default=7, help="Seasonal period (samples)")
+parser.add_argument("--chunksize", type=int, default=1_000_000, help="Rows read per chunk")
+parser.add_argument("--subtract-seasonal", action="store_true",
+                    help="Subtract the idle seasonal profile by sample phase as well as the level")
+parser.add_argument("--plot", action="store_true", help="Show original vs denoised (decimated) when done")
+parser.add_argument("--plot-every", type=int, default=10, help="Keep every n-th sample for --plot")
+args = parser.parse_args()
+
+# === Denoise the idle capture chunk by chunk ===
+preview = []
+
+def keep_preview(part):
+    if args.plot:
+        preview.append(part.iloc[::args.plot_every])
+
+estimator = denoise_csv(args.idle, args.out, args.window, args.period, args.chunksize, keep_preview)
+idle_level = estimator.level()
+seasonal = estimator.seasonal_profile()
+print(f"Idle samples: {estimator.emitted}")
+print(f"Idle baseline level (W): {idle_level:.4f}")
+print(f"Seasonal profile (W): {', '.join(f'{s:+.4f}' for s in seasonal)}")
+print(f"Saved {args.out}")
+
+# === Isolate inference power from a full-load capture ===
+if args.full_load:
+    subtract_baseline_csv(args.full_load, args.isolated_out, idle_level,
+                          seasonal if args.subtract_seasonal else None, args.chunksize)
+    print(f"Saved {args.isolated_out}")
+
+if args.plot:
+    import matplotlib.pyplot as plt
+
+    df = pd.concat(preview)
+    fig, axes = plt.subplots(3, 1, figsize=(12, 8), sharex=True)
+    axes[0].plot(df["Time_s"], df["Power_W"], label="Original", alpha=0.5)
+    axes[0].plot(df["Time_s"], df["Denoised"], label="Denoised (Trend + Seasonal)", linewidth=2)
+    axes[0].legend()
+    axes[1].plot(df["Time_s"], df["Trend"])
+    axes[1].set_ylabel("Trend (W)")
+    axes[2].plot(df["Time_s"], df["Seasonal"])
+    axes[2].set_ylabel("Seasonal (W)")
+    axes[2].set_xlabel("Time (s)")
+    fig.suptitle("Streaming Decomposition of Idle Power")
+    plt.tight_layout()
+    plt.show()
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+# Interval energy accounting over a power trace.
+#
+# Power is treated as piecewise linear between samples, so the energy of any
+# window [start, end) is the difference of the running trapezoidal integral
+# evaluated (with interpolation) at both ends. That needs one cumulative sum
+# over the samples and two binary searches per window: O(samples + windows log
+# samples) instead of one boolean mask over all samples per window.
+
+def cumulative_energy(time_s, power_w):
+    # Running trapezoidal integral, same length as the samples (starts at 0)
+    dt = np.diff(time_s)
+    return np.concatenate([[0.0], np.cumsum((power_w[1:] + power_w[:-1]) * 0.5 * dt)])
+
+def energy_until(time_s, power_w, cum, x):
+    # Integral of the trace from the first sample up to each x (clamped to the trace)
+    x = np.clip(x, time_s[0], time_s[-1])
+    i = np.clip(np.searchsorted(time_s, x, side="right") - 1, 0, len(time_s) - 2)
+    span = time_s[i + 1] - time_s[i]
+    dt = x - time_s[i]
+    frac = np.divide(dt, span, out=np.zeros_like(dt), where=span > 0)
+    p_x = power_w[i] + (power_w[i + 1] - power_w[i]) * frac
+    return cum[i] + (power_w[i] + p_x) * 0.5 * dt
+
+def attribute_energy(time_s, power_w, starts, ends, ids=None, clip_negative=True):
+    # Energy, duration, mean power and sample count for every [start, end) window.
+    # time_s must be sorted; windows may overlap and come in any order.
+    time_s = np.asarray(time_s, dtype=np.float64)
+    power_w = np.asarray(power_w, dtype=np.float64)
+    if clip_negative:
+        # Baseline-subtracted traces dip below zero from noise
+        power_w = np.clip(power_w, 0.0, None)
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+
+    if len(time_s) < 2:
+        energy = np.zeros(len(starts))
+    else:
+        cum = cumulative_energy(time_s, power_w)
+        energy = energy_until(time_s, power_w, cum, ends) - energy_until(time_s, power_w, cum, starts)
+
+    duration = ends - starts
+    samples = np.searchsorted(time_s, ends, side="left") - np.searchsorted(time_s, starts, side="left")
+    mean_power = np.divide(energy, duration, out=np.zeros_like(energy), where=duration > 0)
+
+    return pd.DataFrame({
+        "inference_id": np.arange(len(starts)) if ids is None else np.asarray(ids),
+        "Start": starts,
+        "End": ends,
+        "Duration": duration,
+        "Samples": samples,
+        "Energy": energy,
+        "Mean_Power": mean_power,
+    })
+
+def summarize(results):
+    # Aggregate metrics over the per-window results of attribute_energy
+    total_time = results["Duration"].sum()
+    total_energy = results["Energy"].sum()
+    mean_power = results["Mean_Power"].mean()
+    performance = len(results) / total_time if total_time > 0 else 0.0
+    avg_power = total_energy / total_time if total_time > 0 else 0.0
+
+    return {
+        "inferences": len(results),
+        "mean_energy": results["Energy"].mean(),
+        "mean_power": mean_power,
+        "std_power": results["Mean_Power"].std(),
+        "mead_power": (results["Mean_Power"] - mean_power).abs().mean(),
+        "mean_duration": results["Duration"].mean(),
+        "total_time": total_time,
+        "performance": performance,
+        "efficiency": performance / avg_power if avg_power > 0 else 0.0,
+    }
@@ -0,0 +1,38 @@
+import time
+
+def predict_stream(model, frames, inflight=4):
+    # Feed (frame_id, np_image, preprocessing_time) tuples through DeGirum's
+    # streaming batch API and yield (frame_id, result, timings) in input order.
+    # frame_id is passed through untouched, so any hashable tag works.
+    #
+    # At most `inflight` frames are queued on the device at once. Results come
+    # back in submission order, so the time a frame spends waiting behind the
+    # previous one is its queueing time and the rest is its device time.
+    if hasattr(model, "frame_queue_depth"):
+        model.frame_queue_depth = inflight
+
+    def source():
+        for frame_id, np_image, preprocessing_time in frames:
+            info = {
+                "frame_id": frame_id,
+                "preprocessing_time": preprocessing_time,
+                "submit_ns": time.monotonic_ns(),
+            }
+            yield np_image, info
+
+    last_done = None
+    for result in model.predict_batch(source()):
+        done = time.monotonic_ns()
+        info = result.info
+        submit = info["submit_ns"]
+        start = submit if last_done is None else max(submit, last_done)
+        timings = {
+            "preprocessing_time": info["preprocessing_time"],
+            "inference_time": (done - submit) / 1e9,
+            "queue_time": (start - submit) / 1e9,
+            "device_time": (done - start) / 1e9,
+            "device_start_ns": start,
+            "device_end_ns": done,
+        }
+        last_done = done
+        yield info["frame_id"], result, timings
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import numpy as np
+from PIL import Image
+
+# Host-side benchmark for the run_inference path (decode, preprocess, mask/ROI
+# writes, CSV logging) without a HAILO8 or PySDK. The model is a fake backend
+# with configurable latency and synthetic detections, the frames are a
+# generated uint16 TIFF sequence, and the result is a JSON report of
+# per-stage p50/p95/p99, throughput and peak RSS.
+
+FRAME_SHAPE = (512, 640)  # radiometric frame size (height, width)
+PERCENTILES = (50, 95, 99)
+STAGES = ("preprocessing_time", "inference_time", "postprocessing_time")
+
+# ==== Fake backend ====
+class FakeResult:
+    def __init__(self, results, info=None):
+        self.results = results
+        self.info = info
+
+class FakeModel:
+    # Stands in for a DeGirum model: model(img) and model.predict_batch(source)
+    # sleep for the configured latency and return the same synthetic detections
+    def __init__(self, latency=0.02, jitter=0.0, detections=10, mask_shape=FRAME_SHAPE, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.frame_queue_depth = 8
+        self.rng = np.random.default_rng(seed)
+        self.detections = synthetic_detections(detections, mask_shape, self.rng)
+
+    def _infer(self):
+        delay = self.latency + (self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        time.sleep(max(delay, 0.0))
+        return self.detections
+
+    def __call__(self, np_image):
+        return FakeResult(self._infer())
+
+    def predict_batch(self, source):
+        # One frame on the device at a time, like the accelerator
+        for item in source:
+            np_image, info = item if isinstance(item, tuple) else (item, None)
+            yield FakeResult(self._infer(), info)
+
+def synthetic_detections(count, mask_shape, rng):
+    # Panel-sized boxes on a grid, each with a full-frame mask
+    h, w = mask_shape
+    cols = max(int(np.ceil(np.sqrt(count))), 1)
+    cell_h, cell_w = h // cols, w // cols
+    detections = []
+    for i in range(count):
+        y1, x1 = (i // cols) * cell_h + 2, (i % cols) * cell_w + 2
+        y2, x2 = y1 + max(cell_h - 4, 1), x1 + max(cell_w - 4, 1)
+        mask = np.zeros(mask_shape, dtype=np.uint8)
+        mask[y1:y2, x1:x2] = 1
+        detections.append({"mask": mask, "bbox": [x1, y1, x2, y2], "score": float(rng.uniform(0.5, 1.0))})
+    return detections
+
+def fake_backend(latency, jitter, detections, mask_shape, seed=0):
+    # Loader with dg.load_model's signature, for model_cache.set_backend()
+    def load_model(**kwargs):
+        return FakeModel(latency, jitter, detections, mask_shape, seed)
+    return load_model
+
+# ==== Synthetic frames ====
+def generate_frames(folder, count, shape=FRAME_SHAPE, seed=0):
+    # uint16 thermal-like frames: warm gradient, hotter panel rows, sensor noise
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    base = 29000 + np.linspace(0, 1500, w, dtype=np.float32)[None, :] + np.zeros((h, 1), np.float32)
+    for row in range(h // 8, h, h // 4):
+        base[row:row + h // 8] += 1200
+    for i in range(count):
+        frame = base + rng.normal(0, 40, shape).astype(np.float32)
+        frame = np.roll(frame, i * 3, axis=0)  # drone motion
+        Image.fromarray(frame.clip(0, 65535).astype(np.uint16)).save(os.path.join(folder, f"frame_{i:06d}.tiff"))
+
+# ==== Report ====
+def stage_stats(values):
+    stats = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+    stats["mean"] = float(np.mean(values))
+    return stats
+
+def build_report(config, frame_timings, wall_time, frames=None):
+    # `frames` counts frames skipped by the frame gate too; latencies are over inferred frames
+    frames = len(frame_timings) if frames is None else frames
+    totals = [sum(t[s] for s in STAGES) for t in frame_timings]
+    return {
+        "config": config,
+        "frames": frames,
+        "inferred_frames": len(frame_timings),
+        "wall_time_s": wall_time,
+        "throughput_fps": frames / wall_time if wall_time > 0 else 0.0,
+        "latency_s": {
+            **{s.replace("_time", ""): stage_stats([t[s] for t in frame_timings]) for s in STAGES},
+            "total": stage_stats(totals),
+        },
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark run_inference on synthetic frames with a fake model backend")
+    parser.add_argument("--frames", type=int, default=100, help="Synthetic frames to generate")
+    parser.add_argument("--size", type=int, nargs=2, default=FRAME_SHAPE, metavar=("H", "W"), help="Frame size")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Fake inference latency per frame")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter on the fake latency")
+    parser.add_argument("--detections", type=int, default=10, help="Synthetic detections per frame")
+    parser.add_argument("--mask-shape", type=int, nargs=2, metavar=("H", "W"), help="Mask size (default: frame size)")
+    parser.add_argument("--mode", choices=["serial", "pipelined", "batched"], default="serial")
+    parser.add_argument("--mask-format", choices=["png", "packed"], default="png")
+    parser.add_argument("--prefetch-depth", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--inflight", type=int, default=4)
+    parser.add_argument("--fixed-range", type=int, nargs=2, metavar=("LO", "HI"))
+    parser.add_argument("--warmup", type=int, default=0)
+    parser.add_argument("--skip-threshold", type=float, help="Enable the frame gate (see inference_yolo.py --skip-threshold)")
+    parser.add_argument("--max-skips", type=int, default=4)
+    parser.add_argument("--skip-motion", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace", help="Also record a span trace (CSV + Chrome trace JSON), see tracing.py")
+    parser.add_argument("--workdir", help="Keep frames and outputs here (default: a temporary directory, removed afterwards)")
+    parser.add_argument("--output", default="benchmark_report.json", help="JSON report path")
+    args = parser.parse_args()
+    if args.skip_threshold is not None and args.mode == "batched":
+        parser.error("--skip-threshold is not supported with --mode batched")
+
+    output = os.path.abspath(args.output)
+    trace = os.path.abspath(args.trace) if args.trace else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="pvhawk_bench_")
+    frame_shape = tuple(args.size)
+    mask_shape = tuple(args.mask_shape) if args.mask_shape else frame_shape
+
+    print(f"[INFO] Generating {args.frames} frames ({frame_shape[0]}x{frame_shape[1]} uint16) in {workdir}")
+    generate_frames(os.path.join(workdir, "splitted/radiometric"), args.frames, frame_shape, args.seed)
+
+    # inference_yolo resolves its paths at import, and writes its summary CSV to the cwd
+    os.environ["PVHAWK_WORKDIR"] = workdir
+    os.chdir(workdir)
+    import model_cache
+    import inference_yolo
+    model_cache.set_backend(fake_backend(args.latency_ms / 1000, args.jitter_ms / 1000, args.detections,
+                                         mask_shape, args.seed))
+
+    try:
+        run_start = time.time()
+        frame_timings = inference_yolo.run_inference(
+            pipelined=args.mode == "pipelined", batched=args.mode == "batched",
+            prefetch_depth=args.prefetch_depth, num_workers=args.workers, inflight=args.inflight,
+            mask_format=args.mask_format, fixed_range=args.fixed_range, warmup=args.warmup,
+            trace_path=trace, skip_threshold=args.skip_threshold, max_skips=args.max_skips,
+            skip_motion=args.skip_motion)
+        wall_time = time.time() - run_start
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if not frame_timings:
+        sys.exit("[ERROR] No frames were processed")
+
+    config = {k: v for k, v in vars(args).items() if k not in ("workdir", "output", "trace")}
+    report = build_report(config, frame_timings, wall_time, args.frames)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for stage, stats in report["latency_s"].items():
+        print(f"[INFO] {stage:>14}: " + " | ".join(f"{k} {v * 1000:.2f} ms" for k, v in stats.items()))
+    print(f"[INFO] {report['frames']} frames ({report['inferred_frames']} inferred) in {wall_time:.2f}s ({report['throughput_fps']:.1f} fps), "
+          f"peak RSS {report['peak_rss_mb']:.1f} MB")
+    print(f"[INFO] Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import os
+import time
+
+# CSV logs that every run appends to (timings, benchmark results). When a log
+# on disk was written with other columns, e.g. by a version before a column
+# was added, new rows would end up under the wrong names. Such a log is moved
+# aside to <name>.<timestamp>.csv first and the run starts a fresh one.
+
+def rotate_if_changed(path, header):
+    # True if `path` exists with exactly the columns in `header`, so the caller
+    # appends to it without writing a header
+    if not os.path.isfile(path):
+        return False
+    with open(path, newline="") as f:
+        existing = f.readline().rstrip("\r\n")
+    if existing == ",".join(header):
+        return True
+    root, ext = os.path.splitext(path)
+    rotated = f"{root}.{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+    os.replace(path, rotated)
+    print(f"[INFO] {path} has other columns, moved it to {rotated}")
+    return False
@@ -0,0 +1,83 @@
+import time
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+# Stage start/end markers on time.monotonic_ns(), the same clock the power
+# sampler stamps its records with, so energy can be attributed to the exact
+# interval of every frame and stage afterwards.
+EVENT_DTYPE = np.dtype([
+    ("t_ns", "<i8"),
+    ("frame", "<i4"),
+    ("stage", "u1"),
+    ("kind", "u1"),
+])
+STAGES = ["pre", "inf", "post"]
+STAGE_CODES = {name: code for code, name in enumerate(STAGES)}
+START, END = 0, 1
+
+class EventLog:
+    # Markers are appended to an in-memory list (a tuple append per marker) and
+    # written to `path` as raw EVENT_DTYPE records every `flush_every` markers.
+    # Safe to call from several threads: appends and the flush swap share
+    # `_lock`, the file write holds only `_write_lock`.
+    def __init__(self, path, flush_every=4096):
+        self.path = path
+        self.flush_every = flush_every
+        self._events = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._file = open(path, "wb")
+
+    def mark(self, frame, stage, kind):
+        self._add((time.monotonic_ns(), frame, STAGE_CODES[stage], kind))
+
+    def record(self, frame, stage, start_ns, end_ns):
+        # For intervals measured elsewhere (e.g. device time in batch mode)
+        code = STAGE_CODES[stage]
+        self._add((start_ns, frame, code, START), (end_ns, frame, code, END))
+
+    def _add(self, *events):
+        with self._lock:
+            self._events.extend(events)
+            full = len(self._events) >= self.flush_every
+        if full:
+            self.flush()
+
+    @contextmanager
+    def span(self, frame, stage):
+        self.mark(frame, stage, START)
+        try:
+            yield
+        finally:
+            self.mark(frame, stage, END)
+
+    def flush(self):
+        with self._lock:
+            events, self._events = self._events, []
+        if events:
+            with self._write_lock:
+                np.array(events, dtype=EVENT_DTYPE).tofile(self._file)
+                self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+class NullEventLog:
+    # Drop-in when no event log is requested
+    def mark(self, frame, stage, kind):
+        pass
+
+    def record(self, frame, stage, start_ns, end_ns):
+        pass
+
+    @contextmanager
+    def span(self, frame, stage):
+        yield
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,111 @@
+import numpy as np
+
+# Change-detection gate for run_inference. Consecutive frames of a slow pass
+# are often near-identical. Each frame is reduced to a `scale`x downsampled
+# thumbnail and compared with the thumbnail of the last *inferred* frame:
+# mean absolute difference in gray levels (0-255), after aligning the two by
+# the estimated shift when `motion` is set. Below `threshold` the
+# frame skips inference and reuses the reference frame's detections, shifted
+# by the estimated motion. At most `max_skips` frames in a row are skipped, so
+# slow drift cannot accumulate.
+
+class FrameGate:
+    def __init__(self, threshold, max_skips=4, scale=8, motion=False, max_shift=0.25):
+        self.threshold = threshold
+        self.max_skips = max_skips
+        self.scale = scale
+        self.motion = motion
+        self.max_shift = max_shift  # fraction of the frame size beyond which frames never match
+        self.reference = None  # last inferred frame (its thumbnail without motion)
+        self.reference_id = None
+        self.detections = None
+        self.skips = 0
+        self.inferred = 0
+        self.skipped = 0
+        self._candidate = None
+
+    def thumbnail(self, gray):
+        s = self.scale
+        h, w = gray.shape[0] // s * s, gray.shape[1] // s * s
+        return gray[:h, :w].reshape(h // s, s, w // s, s).mean(axis=(1, 3), dtype=np.float32)
+
+    def decide(self, gray):
+        # (skip, change, (dy, dx) in pixels) for the next frame; call update()
+        # after inferring a frame that was not skipped
+        # Aligning needs the whole frame, otherwise its thumbnail is enough
+        candidate = self._candidate = np.array(gray) if self.motion else self.thumbnail(gray)
+        if self.reference is None or self.skips >= self.max_skips or candidate.shape != self.reference.shape:
+            return False, None, (0, 0)
+
+        if self.motion:
+            dy, dx = estimate_shift(self.reference, candidate)
+            h, w = candidate.shape[:2]
+            if abs(dy) > self.max_shift * h or abs(dx) > self.max_shift * w:
+                return False, None, (0, 0)
+            # Block means of the part both frames cover, aligned to the pixel
+            src_y, dst_y = _overlap(h, dy)
+            src_x, dst_x = _overlap(w, dx)
+            change = float(np.abs(self.thumbnail(candidate[dst_y, dst_x])
+                                  - self.thumbnail(self.reference[src_y, src_x])).mean())
+        else:
+            dy = dx = 0
+            change = float(np.abs(candidate - self.reference).mean())
+        if change >= self.threshold:
+            return False, change, (dy, dx)
+
+        self.skips += 1
+        self.skipped += 1
+        return True, change, (dy, dx)
+
+    def update(self, frame_id, detections):
+        # The frame just inferred becomes the reference
+        self.reference = self._candidate
+        self.reference_id = frame_id
+        self.detections = detections
+        self.skips = 0
+        self.inferred += 1
+
+    def reuse(self, shift):
+        return shift_detections(self.detections, *shift)
+
+def _profile_shift(reference, profile):
+    # Lag maximizing the windowed cross-correlation of two 1-D profiles
+    n = len(profile)
+    window = np.hanning(n)
+    a = np.fft.rfft((reference - reference.mean()) * window)
+    b = np.fft.rfft((profile - profile.mean()) * window)
+    lag = int(np.argmax(np.fft.irfft(b * np.conj(a), n)))
+    return lag - n if lag > n // 2 else lag
+
+def estimate_shift(reference, frame):
+    # (dy, dx) with frame[y + dy, x + dx] ~ reference[y, x], from the row and
+    # column mean profiles (integral projections): pixel-accurate for the
+    # mostly translational motion between consecutive drone frames
+    dy = _profile_shift(reference.mean(axis=1, dtype=np.float32), frame.mean(axis=1, dtype=np.float32))
+    dx = _profile_shift(reference.mean(axis=0, dtype=np.float32), frame.mean(axis=0, dtype=np.float32))
+    return dy, dx
+
+def _overlap(size, shift):
+    # Source and destination slices of an axis moved by `shift`
+    return slice(max(-shift, 0), size - max(shift, 0)), slice(max(shift, 0), size + min(shift, 0))
+
+def shift_detections(detections, dy, dx):
+    # Copies of `detections` moved by (dy, dx) pixels; boxes are clipped to the
+    # frame and detections that leave it are dropped
+    if dy == 0 and dx == 0:
+        return detections
+    shifted = []
+    for det in detections:
+        mask = np.asarray(det["mask"])
+        h, w = mask.shape[:2]
+        x1, y1, x2, y2 = det["bbox"]
+        x1, x2 = min(max(x1 + dx, 0), w), min(max(x2 + dx, 0), w)
+        y1, y2 = min(max(y1 + dy, 0), h), min(max(y2 + dy, 0), h)
+        if x2 <= x1 or y2 <= y1:
+            continue
+        src_y, dst_y = _overlap(h, dy)
+        src_x, dst_x = _overlap(w, dx)
+        moved = np.zeros_like(mask)
+        moved[dst_y, dst_x] = mask[src_y, src_x]
+        shifted.append({**det, "mask": moved, "bbox": [x1, y1, x2, y2]})
+    return shifted
@@ -0,0 +1,213 @@
+import os
+import sys
+import time
+import mmap
+import json
+import struct
+import argparse
+import numpy as np
+from PIL import Image
+
+# Radiometric frames without a directory listing and a decode per frame:
+# - frame_names(): the sorted file names of a frame folder, cached in
+#   .<folder>.index.json next to it and in memory, keyed by the folder's
+#   mtime (changes whenever a file is added or removed). A listing taken
+#   within MTIME_TICK_NS of the mtime is not reused: a file added in the same
+#   timestamp tick would leave the mtime unchanged
+# - read_tiff(): an uncompressed single-channel TIFF whose strips are stored
+#   back to back (what the sequence splitter writes) is returned as a
+#   read-only array over an mmap of the file, no decode and no copy; anything
+#   else goes through PIL
+# - pack_stack()/FrameStack: a whole sequence in one .npy (N, H, W) plus a
+#   .json with the frame names, memory-mapped, so reading a frame is an index
+#   into the page cache instead of a small-file open on the SD card
+
+TIFF_EXTENSIONS = (".tiff", ".tif")
+
+# TIFF tags
+IMAGE_WIDTH, IMAGE_LENGTH, BITS_PER_SAMPLE, COMPRESSION = 256, 257, 258, 259
+STRIP_OFFSETS, SAMPLES_PER_PIXEL, STRIP_BYTE_COUNTS = 273, 277, 279
+TILE_WIDTH, SAMPLE_FORMAT = 322, 339
+TAG_TYPES = {3: "H", 4: "I"}  # SHORT, LONG
+
+MTIME_TICK_NS = 1_000_000_000  # coarsest directory mtime resolution expected (ext3, some network mounts)
+
+_index = {}  # folder -> (mtime_ns, names, {frame_id: [names]}, listed_ns)
+
+def _index_cache_path(folder):
+    folder = os.path.abspath(folder)
+    return os.path.join(os.path.dirname(folder), f".{os.path.basename(folder)}.index.json")
+
+def _settled(mtime_ns, listed_ns):
+    # A listing is complete for this mtime only if it was taken a full tick later
+    return listed_ns - mtime_ns >= MTIME_TICK_NS
+
+def _load_index(folder):
+    mtime_ns = os.stat(folder).st_mtime_ns
+    cached = _index.get(folder)
+    if cached is not None and cached[0] == mtime_ns and _settled(mtime_ns, cached[3]):
+        return cached
+
+    names = None
+    cache_path = _index_cache_path(folder)
+    try:
+        with open(cache_path) as f:
+            saved = json.load(f)
+        if saved["mtime_ns"] == mtime_ns and _settled(mtime_ns, saved["listed_ns"]):
+            names, listed_ns = saved["names"], saved["listed_ns"]
+    except (OSError, ValueError, KeyError):
+        pass
+    if names is None:
+        listed_ns = time.time_ns()
+        names = sorted(f for f in os.listdir(folder) if not f.startswith("."))
+        try:
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"mtime_ns": mtime_ns, "listed_ns": listed_ns, "names": names}, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # Read-only storage: the in-memory index still applies
+
+    by_id = {}
+    for name in names:
+        by_id.setdefault(os.path.splitext(name)[0], []).append(name)
+    cached = _index[folder] = (mtime_ns, names, by_id, listed_ns)
+    return cached
+
+def frame_names(folder, extensions=None):
+    # Sorted names in `folder` (optionally only those ending in `extensions`)
+    names = _load_index(folder)[1]
+    if extensions is None:
+        return list(names)
+    return [name for name in names if name.lower().endswith(extensions)]
+
+def names_for_id(folder, frame_id):
+    # The files of `folder` whose name without extension is `frame_id`
+    return list(_load_index(folder)[2].get(frame_id, ()))
+
+def tiff_layout(buf):
+    # (offset, (height, width), dtype) of a little-endian, uncompressed,
+    # single-channel TIFF with contiguous strips; None for anything else
+    try:
+        return _parse_layout(buf)
+    except struct.error:
+        # Truncated header or offsets past the end of the file
+        return None
+
+def _parse_layout(buf):
+    if len(buf) < 8 or buf[:4] != b"II*\x00" or sys.byteorder != "little":
+        return None
+    ifd = struct.unpack_from("<I", buf, 4)[0]
+    tags = {}
+    for i in range(struct.unpack_from("<H", buf, ifd)[0]):
+        entry = ifd + 2 + 12 * i
+        tag, tag_type, count, value = struct.unpack_from("<HHII", buf, entry)
+        tags[tag] = (tag_type, count, value, entry + 8)
+
+    def values(tag, default=None):
+        if tag not in tags:
+            return default
+        tag_type, count, value, inline = tags[tag]
+        fmt = TAG_TYPES.get(tag_type)
+        if fmt is None:
+            return None
+        size = struct.calcsize(fmt)
+        return struct.unpack_from(f"<{count}{fmt}", buf, inline if count * size <= 4 else value)
+
+    if (values(COMPRESSION, (1,)) != (1,) or values(SAMPLES_PER_PIXEL, (1,)) != (1,)
+            or values(SAMPLE_FORMAT, (1,)) != (1,) or TILE_WIDTH in tags):
+        return None
+    bits = values(BITS_PER_SAMPLE, (1,))
+    dtype = {(8,): np.dtype(np.uint8), (16,): np.dtype("<u2")}.get(bits)
+    width, height = values(IMAGE_WIDTH), values(IMAGE_LENGTH)
+    offsets, counts = values(STRIP_OFFSETS), values(STRIP_BYTE_COUNTS)
+    if dtype is None or not width or not height or not offsets or not counts or len(offsets) != len(counts):
+        return None
+    if any(offsets[i] + counts[i] != offsets[i + 1] for i in range(len(offsets) - 1)):
+        return None
+    width, height = width[0], height[0]
+    if sum(counts) < width * height * dtype.itemsize or offsets[0] + width * height * dtype.itemsize > len(buf):
+        return None
+    return offsets[0], (height, width), dtype
+
+def read_tiff(path):
+    # Read-only HxW array; zero-copy over an mmap when the layout allows it
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            mapped = None  # Empty file, let PIL report it
+    layout = tiff_layout(mapped) if mapped is not None else None
+    if layout is None:
+        if mapped is not None:
+            mapped.close()
+        return np.array(Image.open(path))
+    offset, shape, dtype = layout
+    # The array keeps the mapping alive; it is unmapped when the array is freed
+    return np.frombuffer(mapped, dtype=dtype, count=shape[0] * shape[1], offset=offset).reshape(shape)
+
+def pack_stack(folder, stack_path, extensions=TIFF_EXTENSIONS):
+    # Writes every frame of `folder` to one (N, H, W) .npy and its names to
+    # <stack_path without .npy>.json
+    names = frame_names(folder, extensions)
+    if not names:
+        raise ValueError(f"No frames in {folder}")
+    first = read_tiff(os.path.join(folder, names[0]))
+    tmp_path = stack_path + ".tmp.npy"
+    stack = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=first.dtype, shape=(len(names),) + first.shape)
+    for i, name in enumerate(names):
+        frame = read_tiff(os.path.join(folder, name))
+        if frame.shape != first.shape or frame.dtype != first.dtype:
+            raise ValueError(f"{name} is {frame.dtype} {frame.shape}, expected {first.dtype} {first.shape}")
+        stack[i] = frame
+    stack.flush()
+    del stack
+    with open(os.path.splitext(stack_path)[0] + ".json", "w") as f:
+        json.dump({"names": names}, f)
+    os.replace(tmp_path, stack_path)
+    return len(names)
+
+class FrameStack:
+    def __init__(self, stack_path):
+        self.frames = np.load(stack_path, mmap_mode="r")
+        with open(os.path.splitext(stack_path)[0] + ".json") as f:
+            self.names = json.load(f)["names"]
+        self.positions = {name: i for i, name in enumerate(self.names)}
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def read(self, name):
+        return self.frames[self.positions[name]]
+
+class FrameSource:
+    # Frames of one folder by file name, from the stack when one is given and
+    # holds the frame, else from the file
+    def __init__(self, folder, stack_path=None):
+        self.folder = folder
+        self.stack = FrameStack(stack_path) if stack_path else None
+
+    def names(self, extensions=TIFF_EXTENSIONS):
+        if self.stack is not None and not os.path.isdir(self.folder):
+            return list(self.stack.names)
+        return frame_names(self.folder, extensions)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def exists(self, name):
+        return (self.stack is not None and name in self.stack) or os.path.exists(self.path(name))
+
+    def read(self, name):
+        if self.stack is not None and name in self.stack:
+            return self.stack.read(name)
+        return read_tiff(self.path(name))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack a radiometric frame folder into one memory-mapped frame stack")
+    parser.add_argument("folder", help="Frame folder, e.g. <workdir>/splitted/radiometric")
+    parser.add_argument("stack_path", help="Output .npy (the frame names go to a .json next to it)")
+    args = parser.parse_args()
+
+    print(f"Packed {pack_stack(args.folder, args.stack_path)} frames into {args.stack_path}")
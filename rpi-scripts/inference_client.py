@@ -0,0 +1,88 @@
+import sys
+import json
+import time
+import socket
+import argparse
+
+SOCKET_PATH = "/tmp/hailo_inference.sock"
+
+class InferenceClient:
+    # Client for inference_server.py --socket. Frames are submitted by ID and
+    # answered with their ROIs and timings as soon as each one is done.
+    # `read_timeout` bounds the wait for each reply (TimeoutError), so a hung
+    # server cannot block the caller forever.
+    def __init__(self, socket_path=SOCKET_PATH, connect_timeout=60.0, read_timeout=30.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        deadline = time.monotonic() + connect_timeout
+        while True:
+            try:
+                self.sock.connect(socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                # Server still loading the model
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Inference server not reachable at {socket_path}")
+                time.sleep(0.05)
+        self.sock.settimeout(read_timeout)
+        self.reader = self.sock.makefile("r")
+        self.next_id = 0
+
+    def submit(self, frames):
+        # Yield one reply per frame (in completion order), then stop
+        request_id = self.next_id
+        self.next_id += 1
+        message = {"id": request_id, "frames": list(frames)}
+        self.sock.sendall((json.dumps(message) + "\n").encode())
+
+        for line in self._lines():
+            reply = json.loads(line)
+            if "error" in reply and "frame_id" not in reply:
+                # Bad request; per-frame failures come back as status "error"
+                raise RuntimeError(reply["error"])
+            if reply.get("id") != request_id:
+                continue
+            if reply.get("done"):
+                return
+            yield reply
+        raise ConnectionError("Inference server closed the connection")
+
+    def _lines(self):
+        while True:
+            try:
+                line = self.reader.readline()
+            except socket.timeout:
+                raise TimeoutError("No reply from the inference server") from None
+            if not line:
+                return
+            yield line
+
+    def process(self, frame):
+        replies = list(self.submit([frame]))
+        return replies[0]
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Submit frames to inference_server.py --socket and wait for the results")
+    parser.add_argument("frames", nargs="+", help="Frame IDs or TIFF file names")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Server socket path")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for the server to come up")
+    parser.add_argument("--read-timeout", type=float, default=30.0, help="Seconds to wait for each frame's reply")
+    args = parser.parse_args()
+
+    failed = 0
+    with InferenceClient(args.socket, args.timeout, args.read_timeout) as client:
+        for reply in client.submit(args.frames):
+            print(json.dumps(reply))
+            if reply["status"] != "ok":
+                failed += 1
+    sys.exit(1 if failed else 0)
@@ -1,97 +1,320 @@
 import os
 import sys
 import time
-import select
+import json
+import queue
+import signal
+import socket
+import argparse
+import threading
+from collections import deque
 from PIL import Image
 import numpy as np
-import degirum as dg
+from batch_inference import predict_stream
+import mask_store
+import roi_store
+import model_cache
+import tracing
+import csv_logs
+from preprocessing import Preprocessor
+from frame_source import FrameSource
 
-# Paths
-mask_root = "/home/ggeorgiou/storage/pv-hawk-tutorial/workdir/segmented_yolo/masks"
-roi_root = "/home/ggeorgiou/storage/pv-hawk-tutorial/workdir/segmented_yolo/rois"
-folder_path = "/home/ggeorgiou/storage/pv-hawk-tutorial/workdir/splitted/radiometric"
-csv_log_path = "/home/ggeorgiou/storage/pv-hawk-tutorial/workdir/segmentation_timings.csv"
+# Paths (PVHAWK_WORKDIR overrides the workdir, e.g. for benchmark.py)
+WORKDIR = os.environ.get("PVHAWK_WORKDIR", "/home/ggeorgiou/storage/pv-hawk-tutorial/workdir")
+mask_root = os.path.join(WORKDIR, "segmented_yolo/masks")
+roi_root = os.path.join(WORKDIR, "segmented_yolo/rois")
+mask_store_root = os.path.join(WORKDIR, "segmented_yolo/mask_store")
+roi_store_root = os.path.join(WORKDIR, "segmented_yolo/roi_store")
+folder_path = os.path.join(WORKDIR, "splitted/radiometric")
+csv_log_path = os.path.join(WORKDIR, "segmentation_timings.csv")
+deadline_log_path = os.path.join(WORKDIR, "segmentation_deadlines.csv")
+socket_path = "/tmp/hailo_inference.sock"
 
 os.makedirs(mask_root, exist_ok=True)
 os.makedirs(roi_root, exist_ok=True)
 
-# Initialize CSV log
-if not os.path.exists(csv_log_path):
+# Initialize CSV log (a log with other columns is moved aside)
+csv_log_header = ["frame_id", "model_load_time_s", "preprocessing_time_s", "inference_time_s", "postprocessing_time_s",
+                  "queue_time_s", "device_time_s", "cold_start"]
+if not csv_logs.rotate_if_changed(csv_log_path, csv_log_header):
     with open(csv_log_path, "w") as f:
-        f.write("frame_id,model_load_time_s,preprocessing_time_s,inference_time_s,postprocessing_time_s\n")
-
-# Load the model once
-print("[INFO] Loading HAILO model...")
-model_load_start = time.time()
-model = dg.load_model(
-    model_name="yolov8_seg",
-    inference_host_address="@local",
-    zoo_url="/home/ggeorgiou/hailo/hailo_examples/models",
-    device_type=['HAILORT/HAILO8']
-)
-model_load_time = time.time() - model_load_start
-print(f"[INFO] Model loaded in {model_load_time:.4f}s. Waiting for frames...")
-
-# Open FIFO (stdin)
-fifo_fd = sys.stdin.fileno()
-
-while True:
-    # Wait until FIFO has data
-    rlist, _, _ = select.select([fifo_fd], [], [], 1.0)
-    if fifo_fd not in rlist:
-        continue  # Timeout, no input
-
-    line = sys.stdin.readline()
-    if not line:
-        continue  # EOF or empty line
-
-    image_name = line.strip()
-    if not image_name:
-        continue
-
-    frame_id = os.path.splitext(image_name)[0]
-    image_path = os.path.join(folder_path, image_name)
-
-    if not os.path.exists(image_path):
-        print(f"[WARN] File not found: {image_path}")
-        continue
-
-    print(f"[INFO] Processing {frame_id}")
-
-    # Measure times
-    pre_start = time.time()
-
-    # Preprocess
-    image = Image.open(image_path)
-    np_image = np.array(image)
-
-    if np_image.dtype == np.uint16:
-        np_image = ((np_image - np_image.min()) / np_image.ptp() * 255).astype(np.uint8)
-    if np_image.ndim == 2:
-        np_image = np.stack([np_image] * 3, axis=-1)
-    elif np_image.shape[2] == 1:
-        np_image = np.repeat(np_image, 3, axis=2)
-
-    pre_end = time.time()
-
-    # Inference
-    inf_start = time.time()
-    result = model(np_image)
-    inf_end = time.time()
+        f.write(",".join(csv_log_header) + "\n")
+# Kept open for the server's lifetime; line buffered so every row is on disk as the frame completes
+csv_log = open(csv_log_path, "a", buffering=1)
+
+
+def load_model(warmup=0):
+    print("[INFO] Loading HAILO model...")
+    handle, model_load_time = model_cache.get_model(warmup=warmup)
+    print(f"[INFO] Model loaded in {model_load_time:.4f}s. Waiting for frames...")
+    return handle, model_load_time
+
+# roi_store.RoiWriter with --roi-format columnar, set in __main__
+roi_writer = None
+# Frames by name, from a packed stack with --stack (set in __main__)
+frame_source = FrameSource(folder_path)
+
+# Real-time mode (--realtime): per-frame deadline in ns after the frame arrived
+# and its log, set in __main__
+deadline_ns = None
+deadline_log = None
+deadline_counts = {"on_time": 0, "late": 0, "dropped": 0}
+# Recent processing time per frame (moving average), so deferred frames that
+# would finish past their deadline are dropped before they are started
+service_ns = 0
+
+# Inference times of frames served so far: first (cold unless warmed up) and the rest
+served_times = {"cold": None, "warm": []}
+
+def latency_report(handle, model_load_time):
+    cold_time = served_times["cold"]
+    if cold_time is None and handle.warmup_times:
+        cold_time = handle.warmup_times[0]
+    return model_cache.latency_report(model_load_time, cold_time, served_times["warm"])
+
+
+def frame_file_name(name):
+    # Clients may send either "frame_000123" or "frame_000123.tiff"
+    return name if os.path.splitext(name)[1] else f"{name}.tiff"
+
+
+def read_frame_names():
+    # Yield (image_name, None, arrival_ns) from the FIFO (stdin) as they arrive
+    while True:
+        # Blocking read: select() on the fd would miss lines already in stdin's
+        # buffer when several names arrive at once
+        line = sys.stdin.readline()
+        if not line:
+            time.sleep(0.1)  # EOF: wait for the next writer to open the FIFO
+            continue
+
+        image_name = line.strip()
+        if image_name:
+            yield image_name, None, time.monotonic_ns()
+
+
+class ClientConnection:
+    # One connected socket client. Protocol (one JSON object per line):
+    #   -> {"id": <any>, "frames": ["frame_000001", ...]}
+    #   <- {"id": ..., "frame_id": ..., "status": "ok", "rois": [[x1, y1, x2, y2, 1, score], ...], "timings": {...}}
+    #   <- {"id": ..., "frame_id": ..., "status": "missing"}       (frame file not found)
+    #   <- {"id": ..., "frame_id": ..., "status": "error", "error": "..."} (unreadable frame, model or write failure)
+    #   <- {"id": ..., "frame_id": ..., "status": "dropped"}       (--realtime: stale, not processed)
+    #   <- {"id": ..., "done": true, "count": <frames in request>} (after the last frame)
+    def __init__(self, conn):
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.pending = 0
+        self.pending_cond = threading.Condition()
+
+    def send(self, message):
+        data = (json.dumps(message) + "\n").encode()
+        with self.send_lock:
+            try:
+                self.conn.sendall(data)
+            except OSError:
+                pass  # Client went away, results are still on disk
+
+    def add_pending(self, count):
+        with self.pending_cond:
+            self.pending += count
+
+    def finish_one(self):
+        with self.pending_cond:
+            self.pending -= 1
+            self.pending_cond.notify_all()
+
+    def wait_idle(self):
+        with self.pending_cond:
+            self.pending_cond.wait_for(lambda: self.pending == 0)
+
+
+class ClientRequest:
+    def __init__(self, client, request_id, count):
+        self.client = client
+        self.request_id = request_id
+        self.count = count
+        self.remaining = count
+
+    def reply(self, frame_id, message):
+        message["id"] = self.request_id
+        message["frame_id"] = frame_id
+        self.client.send(message)
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.client.send({"id": self.request_id, "done": True, "count": self.count})
+        self.client.finish_one()
+
+
+def handle_client(conn, work_queue):
+    client = ClientConnection(conn)
+    with conn, conn.makefile("r") as reader:
+        for line in reader:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+                frames = [frame_file_name(f) for f in message["frames"]]
+            except (ValueError, KeyError, TypeError) as e:
+                client.send({"error": f"bad request: {e}"})
+                continue
+
+            request = ClientRequest(client, message.get("id"), len(frames))
+            if not frames:
+                client.send({"id": request.request_id, "done": True, "count": 0})
+                continue
+            client.add_pending(len(frames))
+            for image_name in frames:
+                work_queue.put((image_name, request, time.monotonic_ns()))
+
+        # Client closed its side: finish sending what it asked for before closing
+        client.wait_idle()
+
+
+def read_socket_requests(path):
+    # Yield (image_name, request, arrival_ns) for frames submitted by any connected client.
+    # The socket only appears once the model is loaded, so clients can simply
+    # retry connect() instead of sleeping.
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    work_queue = queue.Queue()
+
+    def accept_loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handle_client, args=(conn, work_queue), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    print(f"[INFO] Listening on {path}")
+    try:
+        while True:
+            yield work_queue.get()
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class LatestFrames:
+    # Bounded buffer between the request readers and the model (--realtime).
+    # get() hands out the newest frame. Older ones are deferred while they can
+    # still meet their deadline and dropped once they cannot (given the recent
+    # processing time), or when the buffer overflows.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = deque()  # arrival order
+        self.dropped = []
+        self.cond = threading.Condition()
+
+    def put(self, item):
+        with self.cond:
+            self.items.append(item)
+            if len(self.items) > self.capacity:
+                self.dropped.append(self.items.popleft())
+            self.cond.notify()
+
+    def get(self):
+        # (newest item, items dropped since the last call)
+        with self.cond:
+            self.cond.wait_for(lambda: self.items)
+            item = self.items.pop()
+            now = time.monotonic_ns()
+            while self.items and now + service_ns - self.items[0][2] > deadline_ns:
+                self.dropped.append(self.items.popleft())
+            dropped, self.dropped = self.dropped, []
+        return item, dropped
 
-    # Postprocess and save
-    post_start = time.time()
-    detections = result.results
-    frame_mask_dir = os.path.join(mask_root, frame_id)
-    os.makedirs(frame_mask_dir, exist_ok=True)
-    roi_data = []
 
-    for i, det in enumerate(detections):
-        mask = det["mask"]
-        mask_img = (mask * 255).astype(np.uint8)
-        mask_pil = Image.fromarray(mask_img)
-        mask_pil.save(os.path.join(frame_mask_dir, f"mask_{i:06d}.png"))
+def realtime_requests(requests, max_queue):
+    # The readers run ahead in a thread; the model always gets the newest frame
+    frames = LatestFrames(max_queue)
 
+    def read_all():
+        for item in requests:
+            frames.put(item)
+
+    threading.Thread(target=read_all, daemon=True).start()
+    while True:
+        item, dropped = frames.get()
+        # Dropped frames are answered here, on the serving thread, like every other reply
+        for image_name, request, arrival_ns in dropped:
+            frame_id = os.path.splitext(image_name)[0]
+            waited = (time.monotonic_ns() - arrival_ns) / 1e9
+            log_deadline(frame_id, "dropped", waited)
+            print(f"[DROP] {frame_id} stale after {waited:.3f}s")
+            if request is not None:
+                request.reply(frame_id, {"status": "dropped"})
+        yield item
+
+
+def log_deadline(frame_id, status, latency, slack=None):
+    deadline_counts[status] += 1
+    deadline_log.write(f"{frame_id},{status},{latency:.4f},{'' if slack is None else f'{slack:.4f}'}\n")
+
+
+def deadline_report():
+    counts = deadline_counts
+    return (f"{deadline_ns / 1e6:.0f} ms deadline: {counts['on_time']} on time, {counts['late']} late, "
+            f"{counts['dropped']} dropped")
+
+
+def preprocess(image_name, preprocessor):
+    # Zero-copy over an mmap of the TIFF (or the frame stack) where possible, see frame_source.py
+    np_image = frame_source.read(image_name)
+    return preprocessor(np_image)
+
+
+def preprocessed_frames(requests, preprocessor):
+    # Yield ((frame_id, request, arrival_ns), np_image, preprocessing_time) for every existing frame
+    for image_name, request, arrival_ns in requests:
+        frame_id = os.path.splitext(image_name)[0]
+        image_path = os.path.join(folder_path, image_name)
+
+        if not frame_source.exists(image_name):
+            print(f"[WARN] File not found: {image_path}")
+            if request is not None:
+                request.reply(frame_id, {"status": "missing"})
+            continue
+
+        print(f"[INFO] Processing {frame_id}")
+        try:
+            with tracing.span("preprocess", "inference", frame_id) as pre:
+                np_image = preprocess(image_name, preprocessor)
+        except Exception as e:
+            fail_frame(frame_id, request, e)  # e.g. a truncated TIFF
+            continue
+        yield (frame_id, request, arrival_ns), np_image, pre.seconds
+
+
+def fail_frame(frame_id, request, error):
+    # A failed frame is answered and logged; the server keeps serving
+    print(f"[ERROR] {frame_id}: {type(error).__name__}: {error}")
+    if request is not None:
+        request.reply(frame_id, {"status": "error", "error": f"{type(error).__name__}: {error}"})
+
+
+def save_outputs(frame_id, detections, mask_format="png", rois=None):
+    if mask_format == "packed":
+        mask_store.write_frame(mask_store_root, frame_id, [det["mask"] for det in detections])
+    else:
+        frame_mask_dir = os.path.join(mask_root, frame_id)
+        os.makedirs(frame_mask_dir, exist_ok=True)
+        for i, det in enumerate(detections):
+            mask = det["mask"]
+            mask_img = (mask * 255).astype(np.uint8)
+            mask_pil = Image.fromarray(mask_img)
+            mask_pil.save(os.path.join(frame_mask_dir, f"mask_{i:06d}.png"))
+
+    if rois is not None:
+        # Columnar store: one append to the sequence's ROI file (see roi_store.py)
+        return roi_store.to_rows(rois.append(frame_id, detections))
+
+    roi_data = []
+    for det in detections:
         x1, y1, x2, y2 = map(int, det["bbox"])
         score = float(det["score"])
         roi_data.append([x1, y1, x2, y2, 1, score])
@@ -101,10 +324,147 @@ while True:
         for row in roi_data:
             f.write(",".join(map(str, row)) + "\n")
 
-    post_end = time.time()
+    return roi_data
+
+
+def finish_frame(tag, result, timings, handle, model_load_time, mask_format="png"):
+    global service_ns
+    frame_id, request, arrival_ns = tag
+    cold = not handle.warm
+    handle.warm = True
+    if cold:
+        served_times["cold"] = timings["inference_time"]
+    else:
+        served_times["warm"].append(timings["inference_time"])
+
+    # Postprocess and save
+    with tracing.span("postprocess", "inference", frame_id) as post:
+        roi_data = save_outputs(frame_id, result.results, mask_format, roi_writer)
+    timings["postprocessing_time"] = post.seconds
 
     # Log timings
-    with open(csv_log_path, "a") as f:
-        f.write(f"{frame_id},{model_load_time:.4f},{pre_end - pre_start:.4f},{inf_end - inf_start:.4f},{post_end - post_start:.4f}\n")
+    csv_log.write(f"{frame_id},{model_load_time:.4f},{timings['preprocessing_time']:.4f},{timings['inference_time']:.4f},"
+                  f"{post.seconds:.4f},{timings['queue_time']:.4f},{timings['device_time']:.4f},{int(cold)}\n")
+
+    reply = {"status": "ok", "rois": roi_data, "timings": timings}
+    if deadline_ns is not None:
+        frame_ns = int((timings["preprocessing_time"] + timings["inference_time"] + post.seconds) * 1e9)
+        service_ns = frame_ns if not service_ns else (4 * service_ns + frame_ns) // 5
+        # Arrival to results on disk, against the capture-rate deadline
+        latency_ns = time.monotonic_ns() - arrival_ns
+        reply["deadline"] = "on_time" if latency_ns <= deadline_ns else "late"
+        log_deadline(frame_id, reply["deadline"], latency_ns / 1e9, (deadline_ns - latency_ns) / 1e9)
+        print(f"[DONE] {frame_id} timings saved to CSV ({reply['deadline']}, {latency_ns / 1e9:.3f}s).")
+    else:
+        print(f"[DONE] {frame_id} timings saved to CSV.")
+
+    if request is not None:
+        request.reply(frame_id, reply)
+
+
+def serve(handle, model_load_time, requests, mask_format="png", fixed_range=None):
+    # One synchronous inference per frame
+    model = handle.model
+    preprocessor = Preprocessor(fixed_range=fixed_range)
+    for tag, np_image, preprocessing_time in preprocessed_frames(requests, preprocessor):
+        try:
+            with tracing.span("inference", "inference", tag[0]) as inf:
+                result = model(np_image)
+            inference_time = inf.seconds
+
+            timings = {
+                "preprocessing_time": preprocessing_time,
+                "inference_time": inference_time,
+                "queue_time": 0.0,
+                "device_time": inference_time,
+            }
+            finish_frame(tag, result, timings, handle, model_load_time, mask_format)
+        except Exception as e:
+            fail_frame(tag[0], tag[1], e)
+
+
+def serve_batched(handle, model_load_time, requests, inflight, mask_format="png", fixed_range=None):
+    # Keep up to `inflight` frames queued on the HAILO8 via predict_batch
+    preprocessor = Preprocessor(fixed_range=fixed_range, num_buffers=inflight + 2)
+    frames = preprocessed_frames(requests, preprocessor)
+    # Device intervals are on time.monotonic_ns(), spans on perf_counter_ns()
+    to_perf_ns = time.perf_counter_ns() - time.monotonic_ns()
+    submitted = deque()  # Tags handed to the model and not yet returned, oldest first
+
+    def tracked(frames):
+        for tag, np_image, preprocessing_time in frames:
+            submitted.append(tag)
+            yield tag, np_image, preprocessing_time
+
+    while True:
+        try:
+            for tag, result, timings in predict_stream(handle.model, tracked(frames), inflight):
+                submitted.popleft()
+                try:
+                    tracing.add("inference", "inference", timings["device_start_ns"] + to_perf_ns,
+                                timings["device_end_ns"] + to_perf_ns, tag[0])
+                    finish_frame(tag, result, timings, handle, model_load_time, mask_format)
+                except Exception as e:
+                    fail_frame(tag[0], tag[1], e)
+            return
+        except Exception as e:
+            # A model error ends the stream: fail the frames it still held and open a new one
+            while submitted:
+                frame_id, request, _ = submitted.popleft()
+                fail_frame(frame_id, request, e)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", action="store_true", help="Stream frames through model.predict_batch")
+    parser.add_argument("--inflight", type=int, default=4, help="Max frames queued on the accelerator (batch mode)")
+    parser.add_argument("--mask-format", choices=["png", "packed"], default="png",
+                        help="png: one PNG per detection; packed: one bit-packed file per frame (see mask_store.py)")
+    parser.add_argument("--fixed-range", type=int, nargs=2, metavar=("LO", "HI"),
+                        help="Sequence-wide raw sensor range for 16-bit normalization (skips per-frame min/max)")
+    parser.add_argument("--socket", nargs="?", const=socket_path, default=None, metavar="PATH",
+                        help=f"Serve requests on a Unix domain socket (default {socket_path}) instead of stdin")
+    parser.add_argument("--roi-format", choices=["csv", "columnar"], default="csv",
+                        help="csv: one rois/<frame_id>.csv per frame; columnar: one indexed store (export with roi_store.py for PV-Hawk)")
+    parser.add_argument("--stack", metavar="NPY", help="Read frames from a stack packed with frame_source.py instead of one TIFF each")
+    parser.add_argument("--warmup", type=int, default=0, help="Inferences on a synthetic frame before serving")
+    parser.add_argument("--trace", metavar="CSV", help="Record pre/inf/post spans to this CSV (and a Chrome trace .json next to it)")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Live mode: always serve the newest frame, drop frames that can no longer meet their deadline")
+    parser.add_argument("--fps", type=float, default=8.0, help="Capture rate; the per-frame deadline is one frame period (--realtime)")
+    parser.add_argument("--deadline-ms", type=float, help="Per-frame deadline after arrival instead of 1/fps (--realtime)")
+    parser.add_argument("--max-queue", type=int, default=2, help="Frames buffered before the oldest is dropped (--realtime)")
+    args = parser.parse_args()
 
-    print(f"[DONE] {frame_id} timings saved to CSV.")
+    # run_per_frame.py stops the server with SIGTERM; exit through the finally below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if args.trace:
+        tracing.start(args.trace, "inference_server")
+    if args.stack:
+        frame_source = FrameSource(folder_path, args.stack)
+    if args.roi_format == "columnar":
+        roi_writer = roi_store.RoiWriter(roi_store_root)
+    handle, model_load_time = load_model(args.warmup)
+    requests = read_socket_requests(args.socket) if args.socket else read_frame_names()
+    if args.realtime:
+        deadline_ns = int((args.deadline_ms / 1000 if args.deadline_ms else 1 / args.fps) * 1e9)
+        deadline_header = ["frame_id", "status", "latency_s", "slack_s"]
+        if not csv_logs.rotate_if_changed(deadline_log_path, deadline_header):
+            with open(deadline_log_path, "w") as f:
+                f.write(",".join(deadline_header) + "\n")
+        deadline_log = open(deadline_log_path, "a", buffering=1)
+        requests = realtime_requests(requests, args.max_queue)
+    try:
+        if args.batch:
+            serve_batched(handle, model_load_time, requests, args.inflight, args.mask_format, args.fixed_range)
+        else:
+            serve(handle, model_load_time, requests, args.mask_format, args.fixed_range)
+    finally:
+        print(f"[INFO] Latency: {latency_report(handle, model_load_time)}")
+        csv_log.close()
+        if deadline_log is not None:
+            print(f"[INFO] Real-time: {deadline_report()}")
+            deadline_log.close()
+        if roi_writer is not None:
+            roi_writer.close()
+        tracing.stop()
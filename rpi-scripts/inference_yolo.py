@@ -1,20 +1,245 @@
 import os
 import time
-import psutil
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import numpy as np
-import degirum as dg
 import csv
 import argparse
+from batch_inference import predict_stream
+import mask_store
+import roi_store
+from preprocessing import Preprocessor
+from frame_source import FrameSource
+from event_log import EventLog, NullEventLog
+import model_cache
+import tracing
+import csv_logs
+from mem_profile import MemoryProfiler, NullMemoryProfiler, log_top_sites
+from frame_gate import FrameGate
 
-mask_root = "/home/ggeorgiou/storage/pv-hawk-tutorial/workdir/segmented_yolo/masks"
-roi_root = "/home/ggeorgiou/storage/pv-hawk-tutorial/workdir/segmented_yolo/rois"
+# PVHAWK_WORKDIR points the script at another workdir (e.g. benchmark.py's synthetic one)
+WORKDIR = os.environ.get("PVHAWK_WORKDIR", "/home/ggeorgiou/storage/pv-hawk-tutorial/workdir")
+mask_root = os.path.join(WORKDIR, "segmented_yolo/masks")
+roi_root = os.path.join(WORKDIR, "segmented_yolo/rois")
+mask_store_root = os.path.join(WORKDIR, "segmented_yolo/mask_store")
+roi_store_root = os.path.join(WORKDIR, "segmented_yolo/roi_store")
 os.makedirs(mask_root, exist_ok=True)
 os.makedirs(roi_root, exist_ok=True)
 
-def run_inference(image_name=None):
+def preprocess_image(source, filename, preprocessor):
+    # Zero-copy over an mmap of the TIFF (or the frame stack) where possible, see frame_source.py
+    np_image = source.read(filename)
+
+    # Normalize 16-bit to 8-bit and expose as 3 channels (see preprocessing.py)
+    return preprocessor(np_image)
+
+def save_detections(frame_id, detections, mask_format="png", rois=None):
+    if mask_format == "packed":
+        # All masks of the frame in one bit-packed file
+        mask_store.write_frame(mask_store_root, frame_id, [det["mask"] for det in detections])
+    else:
+        frame_mask_dir = os.path.join(mask_root, frame_id)
+        os.makedirs(frame_mask_dir, exist_ok=True)
+        for i, det in enumerate(detections):
+            mask = det["mask"]
+            mask_img = (mask * 255).astype(np.uint8)
+            mask_pil = Image.fromarray(mask_img)
+            mask_pil.save(os.path.join(frame_mask_dir, f"mask_{i:06d}.png"))
+
+    if rois is not None:
+        # Columnar store: one append to the sequence's ROI file (see roi_store.py)
+        rois.append(frame_id, detections)
+        return
+
+    roi_data = []
+    for det in detections:
+        x1, y1, x2, y2 = map(int, det["bbox"])
+        score = float(det["score"])
+        roi_data.append([x1, y1, x2, y2, 1, score])
+
+    roi_csv_path = os.path.join(roi_root, f"{frame_id}.csv")
+    with open(roi_csv_path, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerows(roi_data)
+
+def prefetch_frames(source, tiff_files, preprocessor, prefetch_depth=4, num_workers=2, events=NullEventLog(),
+                    mem=NullMemoryProfiler()):
+    # Decode/preprocess in worker threads, at most `prefetch_depth` frames ahead.
+    # Yields (frame_id, np_image, preprocessing_time) in file order.
+    def timed_preprocess(idx, filename):
+        with mem.stage(idx, "pre"), events.span(idx, "pre"), tracing.span("preprocess", "inference", idx) as pre:
+            np_image = preprocess_image(source, filename, preprocessor)
+        return np_image, pre.seconds
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque()
+        files = enumerate(tiff_files)
+        for idx, filename in files:
+            pending.append((filename, executor.submit(timed_preprocess, idx, filename)))
+            if len(pending) >= prefetch_depth:
+                break
+        try:
+            while pending:
+                filename, future = pending.popleft()
+                idx, next_file = next(files, (None, None))
+                if next_file is not None:
+                    pending.append((next_file, executor.submit(timed_preprocess, idx, next_file)))
+                np_image, preprocessing_time = future.result()
+                yield os.path.splitext(filename)[0], np_image, preprocessing_time
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+def check_gate(gate, idx, np_image):
+    # (detections, timings) reusing the last inferred frame's output when the
+    # frame barely changed, None when it needs inference (see frame_gate.py)
+    if gate is None:
+        return None
+    with tracing.span("gate", "inference", idx) as span:
+        skip, change, shift = gate.decide(np_image[:, :, 0] if np_image.ndim == 3 else np_image)
+    if not skip:
+        return None
+    return gate.reuse(shift), {
+        "skipped": True,
+        "reference": gate.reference_id,
+        "change": change,
+        "shift": shift,
+        "gate_time": span.seconds,
+    }
+
+class FrameWriter:
+    # Background thread for mask/ROI writes and logging, fed through a bounded queue
+    def __init__(self, finish_frame, max_pending=4):
+        self.finish_frame = finish_frame
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.errors = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, idx, frame_id, detections, timings):
+        if self.errors:
+            raise self.errors[0]
+        self.queue.put((idx, frame_id, detections, timings))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.errors:
+                continue  # Keep draining so the inference thread never blocks
+            idx, frame_id, detections, timings = item
+            try:
+                self.finish_frame(idx, frame_id, detections, timings)
+            except Exception as e:
+                self.errors.append(e)
+
+def run_serial(model, source, tiff_files, finish_frame, preprocessor, events=NullEventLog(), mem=NullMemoryProfiler(),
+               gate=None):
+    for idx, filename in enumerate(tiff_files):
+        frame_id = os.path.splitext(filename)[0]
+
+        ## ==== Preprocessing Timing ====
+        with mem.stage(idx, "pre"), events.span(idx, "pre"), tracing.span("preprocess", "inference", idx) as pre:
+            np_image = preprocess_image(source, filename, preprocessor)
+
+        reused = check_gate(gate, idx, np_image)
+        if reused is not None:
+            detections, timings = reused
+            timings["preprocessing_time"] = pre.seconds
+            finish_frame(idx, frame_id, detections, timings)
+            continue
+
+        ## ==== Inference Timing ====
+        with mem.stage(idx, "inf"), events.span(idx, "inf"), tracing.span("inference", "inference", idx) as inf:
+            result = model(np_image)
+        if gate is not None:
+            gate.update(frame_id, result.results)
+
+        finish_frame(idx, frame_id, result.results, {
+            "preprocessing_time": pre.seconds,
+            "inference_time": inf.seconds,
+            "queue_time": 0.0,
+            "device_time": inf.seconds,
+        })
+
+def run_pipelined(model, source, tiff_files, finish_frame, preprocessor, prefetch_depth=4, num_workers=2,
+                  events=NullEventLog(), mem=NullMemoryProfiler(), gate=None):
+    # Stage 1: decode/preprocess in worker threads
+    # Stage 2: inference in the calling thread
+    # Stage 3: mask/ROI writes and logging in a background writer thread
+    run_start = time.time()
+    writer = FrameWriter(finish_frame, prefetch_depth)
+    idx = 0
+    try:
+        frames = prefetch_frames(source, tiff_files, preprocessor, prefetch_depth, num_workers, events, mem)
+        for frame_id, np_image, preprocessing_time in frames:
+            reused = check_gate(gate, idx, np_image)
+            if reused is not None:
+                detections, timings = reused
+                timings["preprocessing_time"] = preprocessing_time
+                writer.put(idx, frame_id, detections, timings)
+                idx += 1
+                continue
+
+            with mem.stage(idx, "inf"), events.span(idx, "inf"), tracing.span("inference", "inference", idx) as inf:
+                result = model(np_image)
+            inference_time = inf.seconds
+            if gate is not None:
+                gate.update(frame_id, result.results)
+
+            timings = {
+                "preprocessing_time": preprocessing_time,
+                "inference_time": inference_time,
+                "queue_time": 0.0,
+                "device_time": inference_time,
+            }
+            writer.put(idx, frame_id, result.results, timings)
+            idx += 1
+    finally:
+        writer.close()
+
+    wall_time = time.time() - run_start
+    print(f"Pipelined run: {idx} frames in {wall_time:.2f}s ({wall_time / max(idx, 1) * 1000:.1f} ms/frame)")
+
+def run_batched(model, source, tiff_files, finish_frame, preprocessor, inflight=4, prefetch_depth=4, num_workers=2,
+                events=NullEventLog(), mem=NullMemoryProfiler()):
+    # Keep up to `inflight` frames queued on the accelerator via predict_batch
+    run_start = time.time()
+    writer = FrameWriter(finish_frame, prefetch_depth)
+    # Device intervals are on time.monotonic_ns(), spans on perf_counter_ns()
+    to_perf_ns = time.perf_counter_ns() - time.monotonic_ns()
+    idx = 0
+    try:
+        frames = prefetch_frames(source, tiff_files, preprocessor, prefetch_depth, num_workers, events, mem)
+        for frame_id, result, timings in predict_stream(model, frames, inflight):
+            # Attribute the device interval, not the time spent queued behind other frames
+            events.record(idx, "inf", timings["device_start_ns"], timings["device_end_ns"])
+            tracing.add("inference", "inference", timings["device_start_ns"] + to_perf_ns,
+                        timings["device_end_ns"] + to_perf_ns, idx)
+            writer.put(idx, frame_id, result.results, timings)
+            idx += 1
+    finally:
+        writer.close()
+
+    wall_time = time.time() - run_start
+    print(f"Batched run ({inflight} in flight): {idx} frames in {wall_time:.2f}s ({wall_time / max(idx, 1) * 1000:.1f} ms/frame)")
+
+def run_inference(image_name=None, pipelined=False, prefetch_depth=4, num_workers=2, batched=False, inflight=4,
+                  mask_format="png", fixed_range=None, event_log_path=None, warmup=0, trace_path=None,
+                  mem_every=1, mem_top=0, roi_format="csv", stack_path=None, skip_threshold=None, max_skips=4,
+                  skip_motion=False):
     # ==== CONFIGURATION ====
-    folder_path = "/home/ggeorgiou/storage/pv-hawk-tutorial/workdir/splitted/radiometric"
+    folder_path = os.path.join(WORKDIR, "splitted/radiometric")
     model_name = "yolov8_seg"
     zoo_url = "/home/ggeorgiou/hailo/hailo_examples/models"
     inference_host_address = "@local"
@@ -24,26 +249,28 @@ def run_inference(image_name=None):
     output_log = "benchmark_results.csv"
     per_frame_log = "per_frame_log_full.csv"
     summary_log = "inference_summary.csv"
+    memory_sites_log = "memory_top_sites.csv"
+    skipped_log = "skipped_frames.csv"
     # ========================
 
-    # Measure model loading time
-    model_load_start = time.time()
-    model = dg.load_model(
-        model_name=model_name,
-        inference_host_address=inference_host_address,
-        zoo_url=zoo_url,
-        token=token,
-        device_type=device_type
-    )
-    model_load_end = time.time()
-    model_load_time = model_load_end - model_load_start
+    if skip_threshold is not None and batched:
+        raise ValueError("The frame gate needs frames in order before inference: use serial or pipelined mode")
 
-    process = psutil.Process(os.getpid())
+    # Measure model loading time (0 when an earlier call in this process loaded it)
+    handle, model_load_time = model_cache.get_model(model_name, zoo_url, inference_host_address, token,
+                                                    device_type, warmup=warmup)
+    model = handle.model
+    # Without warm-up, the first frame of the first run in the process is a cold start
+    cold_start = not handle.warm
+    # Per-frame stage times, returned to the caller (see benchmark.py)
+    frame_timings = []
 
+    source = FrameSource(folder_path, stack_path)
     if image_name:
         tiff_files = [image_name]
     else:
-        tiff_files = sorted([f for f in os.listdir(folder_path) if f.lower().endswith(".tiff")])
+        # Sorted names from the cached frame index (no listdir unless the folder changed)
+        tiff_files = [f for f in source.names() if f.lower().endswith(".tiff")]
 
     num_files = len(tiff_files)
 
@@ -51,91 +278,207 @@ def run_inference(image_name=None):
         print("No TIFF files found.")
         return
 
-    total_time = 0
-    peak_mem_usage = 0
+    # RSS around each stage on every `mem_every`-th frame (see mem_profile.py)
+    mem = MemoryProfiler(sample_every=mem_every, top_sites=mem_top)
 
-    mem_before = process.memory_info().rss / (1024 ** 2)
-
-    # === Initialize summary log ===
+    # === Initialize summary log (kept open for the run, rows are buffered) ===
+    summary_file = summary_writer = None
     if log_results:
-        file_exists = os.path.isfile(summary_log)
-        with open(summary_log, "a", newline="") as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(["FrameID", "ModelLoadTime(s)", "PreprocessingTime(s)", "InferenceTime(s)", "PostprocessingTime(s)"])
-
-    for idx, filename in enumerate(tiff_files):
-        filepath = os.path.join(folder_path, filename)
-        frame_id = os.path.splitext(filename)[0]
-
-        ## ==== Preprocessing Timing ====
-        pre_start = time.time()
-
-        image = Image.open(filepath)
-        np_image = np.array(image)
-
-        # Normalize 16-bit to 8-bit
-        if np_image.dtype == np.uint16:
-            np_image = ((np_image - np_image.min()) / np_image.ptp() * 255).astype(np.uint8)
+        header = ["FrameID", "ModelLoadTime(s)", "PreprocessingTime(s)", "InferenceTime(s)", "PostprocessingTime(s)", "QueueTime(s)", "DeviceTime(s)", "ColdStart",
+                  "RSS(MB)", "PreRSSDelta(MB)", "InfRSSDelta(MB)", "PostRSSDelta(MB)"]
+        file_exists = csv_logs.rotate_if_changed(summary_log, header)
+        summary_file = open(summary_log, "a", newline="")
+        summary_writer = csv.writer(summary_file)
+        if not file_exists:
+            summary_writer.writerow(header)
 
-        # Ensure 3 channels
-        if np_image.ndim == 2:
-            np_image = np.stack([np_image] * 3, axis=-1)
-        elif np_image.shape[2] == 1:
-            np_image = np.repeat(np_image, 3, axis=2)
+    # Stage markers on the power sampler's clock (see event_log.py)
+    events = EventLog(event_log_path) if event_log_path else NullEventLog()
+    rois = roi_store.RoiWriter(roi_store_root) if roi_format == "columnar" else None
 
-        pre_end = time.time()
-        preprocessing_time = pre_end - pre_start
-
-        ## ==== Inference Timing ====
-        inf_start = time.time()
-        result = model(np_image)
-        inf_end = time.time()
-        inference_time = inf_end - inf_start
+    # Optional change-detection gate; skipped frames are logged to their own CSV
+    gate = skipped_file = skipped_writer = None
+    if skip_threshold is not None:
+        gate = FrameGate(skip_threshold, max_skips=max_skips, motion=skip_motion)
+        if log_results:
+            header = ["FrameID", "ReferenceFrame", "Change", "ShiftY(px)", "ShiftX(px)",
+                      "PreprocessingTime(s)", "GateTime(s)", "PostprocessingTime(s)"]
+            file_exists = csv_logs.rotate_if_changed(skipped_log, header)
+            skipped_file = open(skipped_log, "a", newline="")
+            skipped_writer = csv.writer(skipped_file)
+            if not file_exists:
+                skipped_writer.writerow(header)
 
+    def finish_frame(idx, frame_id, detections, timings):
         ## ==== Postprocessing Timing ====
-        post_start = time.time()
-        detections = result.results
+        with mem.stage(idx, "post"), events.span(idx, "post"), tracing.span("postprocess", "inference", idx) as post:
+            save_detections(frame_id, detections, mask_format, rois)
+        postprocessing_time = post.seconds
 
-        frame_mask_dir = os.path.join(mask_root, frame_id)
-        os.makedirs(frame_mask_dir, exist_ok=True)
-        roi_data = []
-
-        for i, det in enumerate(detections):
-            mask = det["mask"]
-            mask_img = (mask * 255).astype(np.uint8)
-            mask_pil = Image.fromarray(mask_img)
-            mask_pil.save(os.path.join(frame_mask_dir, f"mask_{i:06d}.png"))
-
-            x1, y1, x2, y2 = map(int, det["bbox"])
-            score = float(det["score"])
-            roi_data.append([x1, y1, x2, y2, 1, score])
+        preprocessing_time = timings["preprocessing_time"]
+        # Blank memory columns on frames that were not sampled
+        memory = mem.take(idx) or {}
+        if timings.get("skipped"):
+            # No inference: kept out of frame_timings and the inference summary
+            dy, dx = timings["shift"]
+            if log_results:
+                skipped_writer.writerow([
+                    frame_id,
+                    timings["reference"],
+                    f"{timings['change']:.3f}",
+                    dy,
+                    dx,
+                    f"{preprocessing_time:.4f}",
+                    f"{timings['gate_time']:.4f}",
+                    f"{postprocessing_time:.4f}",
+                ])
+            print(f"[{idx+1}/{num_files}] {frame_id}: Pre {preprocessing_time:.4f} | Skipped (change {timings['change']:.2f}, "
+                  f"reusing {timings['reference']} shifted {dy},{dx}) | Post {postprocessing_time:.4f}")
+            return
 
-        roi_csv_path = os.path.join(roi_root, f"{frame_id}.csv")
-        with open(roi_csv_path, "w", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerows(roi_data)
-        post_end = time.time()
-        postprocessing_time = post_end - post_start
+        inference_time = timings["inference_time"]
+        cold = cold_start and idx == 0
+        frame_timings.append({
+            "frame_id": frame_id,
+            "preprocessing_time": preprocessing_time,
+            "inference_time": inference_time,
+            "postprocessing_time": postprocessing_time,
+        })
 
         ## ==== Log Summary ====
         if log_results:
-            with open(summary_log, "a", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    frame_id,
-                    f"{model_load_time:.4f}",
-                    f"{preprocessing_time:.4f}",
-                    f"{inference_time:.4f}",
-                    f"{postprocessing_time:.4f}"
-                ])
+            summary_writer.writerow([
+                frame_id,
+                f"{model_load_time:.4f}",
+                f"{preprocessing_time:.4f}",
+                f"{inference_time:.4f}",
+                f"{postprocessing_time:.4f}",
+                f"{timings['queue_time']:.4f}",
+                f"{timings['device_time']:.4f}",
+                int(cold),
+                *(f"{memory[key]:.2f}" if key in memory else "" for key in ("rss", "pre", "inf", "post"))
+            ])
 
         print(f"[{idx+1}/{num_files}] {frame_id}: Pre {preprocessing_time:.4f} | Inf {inference_time:.4f} | Post {postprocessing_time:.4f}")
 
+    # Output buffers are reused, so keep one per frame that can be alive at once:
+    # queued + being decoded + on the accelerator
+    if batched:
+        num_buffers = prefetch_depth + num_workers + inflight + 1
+    elif pipelined:
+        num_buffers = prefetch_depth + num_workers + 1
+    else:
+        num_buffers = 1
+    preprocessor = Preprocessor(fixed_range=fixed_range, num_buffers=num_buffers)
+
+    if trace_path:
+        tracing.start(trace_path, "inference")
+    run_start = time.time()
+    try:
+        if batched:
+            run_batched(model, source, tiff_files, finish_frame, preprocessor, inflight, prefetch_depth, num_workers,
+                        events, mem)
+        elif pipelined:
+            run_pipelined(model, source, tiff_files, finish_frame, preprocessor, prefetch_depth, num_workers,
+                          events, mem, gate)
+        else:
+            run_serial(model, source, tiff_files, finish_frame, preprocessor, events, mem, gate)
+    finally:
+        events.close()
+        if rois is not None:
+            rois.close()
+        if summary_file is not None:
+            summary_file.close()
+        if skipped_file is not None:
+            skipped_file.close()
+        if trace_path:
+            tracing.stop()
+        mem.close()
+    total_time = time.time() - run_start
+    skipped = gate.skipped if gate is not None else 0
+    if gate is not None:
+        print(f"[INFO] Frame gate: {gate.inferred} inferred, {skipped} skipped "
+              f"({skipped / max(gate.inferred + skipped, 1) * 100:.0f}% of inferences saved)")
+
+    # === Run summary: wall time and memory ===
+    memory = mem.summary()
+    peak_mem_usage = memory["peak_rss"]
+    growth = memory["growth"]
+    min_available = f"{memory['min_available']:.1f}" if memory["min_available"] is not None else ""
+    print(f"[INFO] Memory: RSS {memory['rss_before']:.1f} -> {memory['rss_after']:.1f} MB, peak {peak_mem_usage:.1f} MB, "
+          f"growth pre {growth.get('pre', 0.0):.1f} / inf {growth.get('inf', 0.0):.1f} / post {growth.get('post', 0.0):.1f} MB")
+    if log_results:
+        header = ["Timestamp", "Mode", "Frames", "TotalTime(s)", "RSSBefore(MB)", "RSSAfter(MB)",
+                  "PeakRSS(MB)", "PreRSSGrowth(MB)", "InfRSSGrowth(MB)", "PostRSSGrowth(MB)",
+                  "MinAvailable(MB)"]
+        file_exists = csv_logs.rotate_if_changed(output_log, header)
+        with open(output_log, "a", newline="") as f:
+            writer = csv.writer(f)
+            if not file_exists:
+                writer.writerow(header)
+            writer.writerow([
+                time.strftime("%Y-%m-%d %H:%M:%S"),
+                ("batched" if batched else "pipelined" if pipelined else "serial") + ("+gate" if gate is not None else ""),
+                len(frame_timings) + skipped,
+                f"{total_time:.2f}",
+                f"{memory['rss_before']:.1f}",
+                f"{memory['rss_after']:.1f}",
+                f"{peak_mem_usage:.1f}",
+                *(f"{growth.get(stage, 0.0):.1f}" for stage in ("pre", "inf", "post")),
+                min_available,
+            ])
+        if mem_top:
+            log_top_sites(memory_sites_log, mem)
+
+    inference_times = [t["inference_time"] for t in frame_timings]
+    if inference_times:
+        handle.warm = True
+        if cold_start:
+            cold_time, warm_times = inference_times[0], inference_times[1:]
+        elif handle.warmup_times:
+            cold_time, warm_times = handle.warmup_times[0], inference_times
+        else:
+            cold_time, warm_times = None, inference_times
+        print(f"[INFO] Latency: {model_cache.latency_report(model_load_time, cold_time, warm_times)}")
+    return frame_timings
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--image", type=str, help="Optional: process only a specific TIFF image (just filename, not full path)")
+    parser.add_argument("--pipelined", action="store_true", help="Overlap decode/preprocess, inference and mask/ROI writes across frames")
+    parser.add_argument("--prefetch-depth", type=int, default=4, help="Max frames queued between pipeline stages (pipelined mode)")
+    parser.add_argument("--workers", type=int, default=2, help="Decode/preprocess worker threads (pipelined mode)")
+    parser.add_argument("--batch", action="store_true", help="Stream frames through model.predict_batch instead of one synchronous call per frame")
+    parser.add_argument("--inflight", type=int, default=4, help="Max frames queued on the accelerator (batch mode)")
+    parser.add_argument("--mask-format", choices=["png", "packed"], default="png",
+                        help="png: one PNG per detection; packed: one bit-packed file per frame (see mask_store.py)")
+    parser.add_argument("--fixed-range", type=int, nargs=2, metavar=("LO", "HI"),
+                        help="Sequence-wide raw sensor range for 16-bit normalization (skips per-frame min/max)")
+    parser.add_argument("--event-log", type=str, help="Write per-frame pre/inf/post start/end markers (monotonic clock) to this file")
+    parser.add_argument("--warmup", type=int, default=0, help="Inferences on a synthetic frame before the first real one")
+    parser.add_argument("--trace", type=str, metavar="CSV", help="Record pre/inf/post spans to this CSV (and a Chrome trace .json next to it)")
+    parser.add_argument("--stack", type=str, metavar="NPY",
+                        help="Read frames from a stack packed with frame_source.py instead of one TIFF each")
+    parser.add_argument("--roi-format", choices=["csv", "columnar"], default="csv",
+                        help="csv: one rois/<frame_id>.csv per frame; columnar: one indexed store (export with roi_store.py for PV-Hawk)")
+    parser.add_argument("--mem-every", type=int, default=1, metavar="N",
+                        help="Measure per-stage RSS deltas on every Nth frame (0 = off; e.g. 50 for production runs)")
+    parser.add_argument("--mem-top", type=int, default=0, metavar="N",
+                        help="Log the N top tracemalloc allocation sites of preprocessing/postprocessing (slow, diagnosis only)")
+    parser.add_argument("--skip-threshold", type=float, metavar="T",
+                        help="Reuse the last inferred frame's masks/ROIs when a frame differs from it by less than T "
+                             "gray levels (mean abs difference of 8x downsampled frames); serial/pipelined mode only")
+    parser.add_argument("--max-skips", type=int, default=4, metavar="N", help="Max consecutive frames skipped by --skip-threshold")
+    parser.add_argument("--skip-motion", action="store_true",
+                        help="Estimate the shift against the last inferred frame and move the reused masks/ROIs with it")
     args = parser.parse_args()
+    if args.skip_threshold is not None and args.batch:
+        parser.error("--skip-threshold is not supported with --batch")
 
-    run_inference(args.image)
+    run_inference(args.image, pipelined=args.pipelined, prefetch_depth=args.prefetch_depth, num_workers=args.workers,
+                  batched=args.batch, inflight=args.inflight, mask_format=args.mask_format,
+                  fixed_range=args.fixed_range, event_log_path=args.event_log, warmup=args.warmup,
+                  trace_path=args.trace, mem_every=args.mem_every, mem_top=args.mem_top,
+                  roi_format=args.roi_format, stack_path=args.stack, skip_threshold=args.skip_threshold,
+                  max_skips=args.max_skips, skip_motion=args.skip_motion)
@@ -0,0 +1,137 @@
+import os
+import argparse
+import numpy as np
+from PIL import Image
+
+# One file per frame holding every detection mask, each cropped to its
+# nonzero bounding box and bit-packed:
+#   shape   (2,)    full frame height, width
+#   boxes   (N, 4)  y0, x0, y1, x1 of each crop (half-open)
+#   offsets (N+1,)  byte offsets of each mask into `bits`
+#   bits    (M,)    np.packbits of every crop, row-major, concatenated
+#   dense   (N,)    1 where the crop is not binary (soft mask): its bytes are
+#                   then the legacy PNG values (mask * 255 as uint8), unpacked
+# Files written before `dense` existed hold binary masks only.
+
+def pack_masks(masks, shape=None):
+    boxes = []
+    chunks = []
+    offsets = [0]
+
+    dense = []
+
+    for mask in masks:
+        mask = np.asarray(mask)
+        nonzero = mask != 0
+        if shape is None:
+            shape = mask.shape
+
+        rows = np.flatnonzero(nonzero.any(axis=1))
+        if len(rows) == 0:
+            boxes.append((0, 0, 0, 0))
+            offsets.append(offsets[-1])
+            dense.append(0)
+            continue
+        cols = np.flatnonzero(nonzero.any(axis=0))
+        y0, y1 = rows[0], rows[-1] + 1
+        x0, x1 = cols[0], cols[-1] + 1
+
+        crop = mask[y0:y1, x0:x1]
+        if ((crop == 0) | (crop == 1)).all():
+            packed = np.packbits(nonzero[y0:y1, x0:x1])
+            dense.append(0)
+        else:
+            # Soft mask: keep exactly what the legacy PNG would hold
+            packed = (crop * 255).astype(np.uint8).ravel()
+            dense.append(1)
+        boxes.append((y0, x0, y1, x1))
+        chunks.append(packed)
+        offsets.append(offsets[-1] + len(packed))
+
+    return {
+        "shape": np.array(shape if shape is not None else (0, 0), dtype=np.int32),
+        "boxes": np.array(boxes, dtype=np.int32).reshape(-1, 4),
+        "offsets": np.array(offsets, dtype=np.int64),
+        "bits": np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint8),
+        "dense": np.array(dense, dtype=np.uint8),
+    }
+
+def unpack_mask(packed, index):
+    height, width = packed["shape"]
+    y0, x0, y1, x1 = packed["boxes"][index]
+    start, end = packed["offsets"][index], packed["offsets"][index + 1]
+
+    mask = np.zeros((height, width), dtype=np.uint8)
+    crop_h, crop_w = y1 - y0, x1 - x0
+    if crop_h and crop_w:
+        if "dense" in packed and packed["dense"][index]:
+            mask[y0:y1, x0:x1] = packed["bits"][start:end].reshape(crop_h, crop_w)
+        else:
+            crop = np.unpackbits(packed["bits"][start:end], count=crop_h * crop_w)
+            mask[y0:y1, x0:x1] = crop.reshape(crop_h, crop_w) * 255
+    return mask
+
+def write_frame(store_root, frame_id, masks, shape=None):
+    os.makedirs(store_root, exist_ok=True)
+    packed = pack_masks(masks, shape)
+    tmp_path = os.path.join(store_root, f".{frame_id}.tmp.npz")
+    np.savez(tmp_path, **packed)
+    os.replace(tmp_path, os.path.join(store_root, f"{frame_id}.npz"))
+
+class MaskStore:
+    def __init__(self, store_root):
+        self.store_root = store_root
+        self._cached_id = None
+        self._cached = None
+
+    def frame_ids(self):
+        return sorted(f[:-4] for f in os.listdir(self.store_root) if f.endswith(".npz") and not f.startswith("."))
+
+    def _load(self, frame_id):
+        if frame_id != self._cached_id:
+            with np.load(os.path.join(self.store_root, f"{frame_id}.npz")) as data:
+                self._cached = {k: data[k] for k in data.files}
+            self._cached_id = frame_id
+        return self._cached
+
+    def count(self, frame_id):
+        return len(self._load(frame_id)["boxes"])
+
+    def boxes(self, frame_id):
+        return self._load(frame_id)["boxes"]
+
+    def read_mask(self, frame_id, index):
+        # Full-frame uint8 mask, identical to the legacy mask PNG
+        return unpack_mask(self._load(frame_id), index)
+
+    def read_masks(self, frame_id):
+        packed = self._load(frame_id)
+        return [unpack_mask(packed, i) for i in range(len(packed["boxes"]))]
+
+    def export_png(self, frame_id, mask_root):
+        # Write the legacy layout: <mask_root>/<frame_id>/mask_000000.png, ...
+        frame_mask_dir = os.path.join(mask_root, frame_id)
+        os.makedirs(frame_mask_dir, exist_ok=True)
+        for i, mask in enumerate(self.read_masks(frame_id)):
+            Image.fromarray(mask).save(os.path.join(frame_mask_dir, f"mask_{i:06d}.png"))
+
+    def export_all_png(self, mask_root):
+        frame_ids = self.frame_ids()
+        for frame_id in frame_ids:
+            self.export_png(frame_id, mask_root)
+        return len(frame_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a packed mask store to per-detection PNGs")
+    parser.add_argument("store_root", help="Directory holding <frame_id>.npz mask files")
+    parser.add_argument("mask_root", help="Output directory for <frame_id>/mask_XXXXXX.png")
+    parser.add_argument("--frame", type=str, help="Optional: export only this frame ID")
+    args = parser.parse_args()
+
+    store = MaskStore(args.store_root)
+    if args.frame:
+        store.export_png(args.frame, args.mask_root)
+        print(f"Exported {store.count(args.frame)} masks for {args.frame}")
+    else:
+        print(f"Exported {store.export_all_png(args.mask_root)} frames to {args.mask_root}")
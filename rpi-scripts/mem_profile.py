@@ -0,0 +1,127 @@
+import os
+import time
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager
+import psutil
+import csv_logs
+
+# Per-stage memory accounting for run_inference. On every `sample_every`-th
+# frame the process RSS is read before and after each stage (a /proc read,
+# tens of µs), so a production run can sample e.g. every 50th frame.
+# With `top_sites` set, tracemalloc also records which source lines the
+# preprocessing and postprocessing allocations come from. That costs two
+# snapshots per sampled stage, so keep it for diagnosis runs.
+#
+# RSS is per process: in pipelined/batched mode stages of different frames
+# overlap and their deltas include each other's allocations. Serial mode gives
+# exact per-stage numbers.
+
+MB = 1024 ** 2
+SITE_STAGES = ("pre", "post")
+
+def peak_rss_mb():
+    # True process high-water mark; ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class MemoryProfiler:
+    def __init__(self, sample_every=1, top_sites=0):
+        self.process = psutil.Process(os.getpid())
+        self.sample_every = sample_every
+        self.top_sites = top_sites
+        self.rss_before = self.rss_mb()
+        self.frames = {}  # frame index -> {"rss": MB, stage: RSS delta in MB}
+        self.growth = {}  # stage -> summed RSS growth over the sampled frames
+        self.sites = {stage: {} for stage in SITE_STAGES}  # stage -> site -> [bytes, blocks]
+        self.min_available = None
+        self._lock = threading.Lock()
+        if top_sites and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def rss_mb(self):
+        return self.process.memory_info().rss / MB
+
+    def sampled(self, idx):
+        return self.sample_every > 0 and idx % self.sample_every == 0
+
+    @contextmanager
+    def stage(self, idx, name):
+        if not self.sampled(idx):
+            yield
+            return
+        snapshot = self._snapshot() if self.top_sites and name in SITE_STAGES else None
+        before = self.rss_mb()
+        try:
+            yield
+        finally:
+            after = self.rss_mb()
+            with self._lock:
+                record = self.frames.setdefault(idx, {})
+                record[name] = after - before
+                record["rss"] = after
+            if snapshot is not None:
+                self._add_sites(name, self._snapshot().compare_to(snapshot, "lineno"))
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    def _add_sites(self, stage, diffs):
+        with self._lock:
+            sites = self.sites[stage]
+            for stat in diffs:
+                if stat.size_diff > 0:
+                    site = sites.setdefault(str(stat.traceback[0]), [0, 0])
+                    site[0] += stat.size_diff
+                    site[1] += stat.count_diff
+
+    def take(self, idx):
+        # The frame's record once all its stages ran: None if it was not sampled
+        with self._lock:
+            record = self.frames.pop(idx, None)
+            if record is None:
+                return None
+            for stage, delta in record.items():
+                if stage != "rss" and delta > 0:
+                    self.growth[stage] = self.growth.get(stage, 0.0) + delta
+        available = psutil.virtual_memory().available / MB
+        if self.min_available is None or available < self.min_available:
+            self.min_available = available
+        return record
+
+    def top(self, stage):
+        # [(site, bytes, blocks)] with the most growth first
+        sites = sorted(self.sites[stage].items(), key=lambda item: item[1][0], reverse=True)
+        return [(site, size, count) for site, (size, count) in sites[:self.top_sites]]
+
+    def summary(self):
+        return {
+            "rss_before": self.rss_before,
+            "rss_after": self.rss_mb(),
+            "peak_rss": peak_rss_mb(),
+            "growth": dict(self.growth),
+            "min_available": self.min_available,
+        }
+
+    def close(self):
+        if self.top_sites:
+            tracemalloc.stop()
+
+class NullMemoryProfiler:
+    # Drop-in for callers that do not account memory
+    @contextmanager
+    def stage(self, idx, name):
+        yield
+
+def log_top_sites(path, profiler):
+    # Appends the top allocation sites of this run to `path`
+    header = ["Timestamp", "Stage", "Site", "Size(KB)", "Blocks"]
+    file_exists = csv_logs.rotate_if_changed(path, header)
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    with open(path, "a") as f:
+        if not file_exists:
+            f.write(",".join(header) + "\n")
+        for stage in SITE_STAGES:
+            for site, size, count in profiler.top(stage):
+                f.write(f"{timestamp},{stage},{site},{size / 1024:.1f},{count}\n")
+                print(f"[INFO] Top {stage} allocations: {site} +{size / 1024:.1f} KB ({count} blocks)")
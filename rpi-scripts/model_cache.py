@@ -0,0 +1,83 @@
+import time
+import threading
+import numpy as np
+try:
+    import degirum as dg
+except ImportError:
+    dg = None  # No PySDK on this host: set_backend() must be called first
+
+# Model handles shared by every run_inference() call (and the server) in one
+# process, so only the first caller pays for dg.load_model. An optional warm-up
+# runs inferences on a synthetic frame before real traffic, so the first real
+# frame is not an outlier from lazy runtime/device initialization.
+
+MODEL_NAME = "yolov8_seg"
+ZOO_URL = "/home/ggeorgiou/hailo/hailo_examples/models"
+INFERENCE_HOST_ADDRESS = "@local"
+DEVICE_TYPE = ['HAILORT/HAILO8']
+WARMUP_SHAPE = (512, 640)  # radiometric frame size; the model resizes anyway
+
+class CachedModel:
+    def __init__(self, model, load_time):
+        self.model = model
+        self.load_time = load_time
+        self.warmup_times = []
+        # False until the model has run once (warm-up or a real frame); the
+        # first inference after that is a cold start
+        self.warm = False
+
+_models = {}
+_lock = threading.Lock()
+# Called like dg.load_model; swapped for a fake by benchmark.py
+_load_model = dg.load_model if dg is not None else None
+
+def set_backend(load_model):
+    # Later get_model() calls load through `load_model`; drops cached handles
+    global _load_model
+    with _lock:
+        _load_model = load_model
+        _models.clear()
+
+def get_model(model_name=MODEL_NAME, zoo_url=ZOO_URL, inference_host_address=INFERENCE_HOST_ADDRESS, token='',
+              device_type=DEVICE_TYPE, warmup=0):
+    # Returns (handle, load_time); load_time is 0.0 when the handle was cached
+    key = (model_name, zoo_url, inference_host_address, tuple(device_type))
+    with _lock:
+        handle = _models.get(key)
+        load_time = 0.0
+        if handle is None:
+            if _load_model is None:
+                raise RuntimeError("degirum is not installed and no model backend was set")
+            model_load_start = time.time()
+            model = _load_model(
+                model_name=model_name,
+                inference_host_address=inference_host_address,
+                zoo_url=zoo_url,
+                token=token,
+                device_type=device_type
+            )
+            load_time = time.time() - model_load_start
+            handle = _models[key] = CachedModel(model, load_time)
+        if warmup and not handle.warm:
+            warm_up(handle, warmup)
+    return handle, load_time
+
+def warm_up(handle, iterations=1, shape=WARMUP_SHAPE):
+    # Mid-gray frame: not empty (no degenerate normalization) and no detections
+    frame = np.full((*shape, 3), 128, dtype=np.uint8)
+    for _ in range(iterations):
+        start = time.time()
+        handle.model(frame)
+        handle.warmup_times.append(time.time() - start)
+    handle.warm = True
+    times = ", ".join(f"{t:.4f}" for t in handle.warmup_times)
+    print(f"[INFO] Warm-up inference times (s): {times}")
+
+def latency_report(load_time, cold_time, warm_times):
+    # One line: load cost, first inference and the steady-state mean
+    parts = [f"model load {load_time:.3f}s" if load_time else "model cached"]
+    if cold_time is not None:
+        parts.append(f"cold first inference {cold_time:.4f}s")
+    if warm_times:
+        parts.append(f"warm inference mean {np.mean(warm_times):.4f}s (p50 {np.median(warm_times):.4f}s, n={len(warm_times)})")
+    return ", ".join(parts)
@@ -0,0 +1,197 @@
+import os
+import time
+import argparse
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+# One INA219 reading. t_ns is time.monotonic_ns() (CLOCK_MONOTONIC), which is
+# shared by every process on the Pi, so samples line up with timestamps taken
+# in the inference process.
+RECORD_DTYPE = np.dtype([
+    ("t_ns", "<i8"),
+    ("bus_v", "<f4"),
+    ("current_ma", "<f4"),
+    ("power_w", "<f4"),
+])
+HEADER_BYTES = 8  # uint64 count of records ever written
+
+def open_ina219():
+    import board
+    from adafruit_ina219 import INA219
+
+    ina219 = INA219(board.I2C())
+    ina219.set_calibration_16V_2_5A()
+    return ina219
+
+def _ring_views(shm, capacity):
+    head = np.ndarray((1,), dtype=np.uint64, buffer=shm.buf, offset=0)
+    ring = np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=shm.buf, offset=HEADER_BYTES)
+    return head, ring
+
+def _flush(ring, capacity, log_file, start, end):
+    # Append records [start, end) to the log, handling ring wrap-around
+    while start < end:
+        i = start % capacity
+        n = min(end - start, capacity - i)
+        ring[i:i + n].tofile(log_file)
+        start += n
+    log_file.flush()
+
+def _sampler_main(shm_name, capacity, rate_hz, log_path, flush_every, stop_event, ready_event, sensor_factory):
+    sensor = sensor_factory()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        head, ring = _ring_views(shm, capacity)
+        period_ns = int(1e9 / rate_hz)
+        count = 0
+        flushed = 0
+
+        with open(log_path, "wb") as log_file:
+            ready_event.set()
+            next_t = time.monotonic_ns()
+            while not stop_event.is_set():
+                now = time.monotonic_ns()
+                remaining = next_t - now
+                if remaining > 200_000:
+                    time.sleep((remaining - 100_000) / 1e9)
+                    continue
+                if remaining > 0:
+                    continue  # Spin for the last ~0.2 ms
+
+                t0 = time.monotonic_ns()
+                bus_v = sensor.bus_voltage
+                current = sensor.current
+                power = sensor.power
+                t1 = time.monotonic_ns()
+
+                slot = ring[count % capacity]
+                slot["t_ns"] = (t0 + t1) // 2
+                slot["bus_v"] = bus_v
+                slot["current_ma"] = current
+                slot["power_w"] = power
+                count += 1
+                head[0] = count
+
+                if count - flushed >= flush_every:
+                    _flush(ring, capacity, log_file, flushed, count)
+                    flushed = count
+
+                next_t += period_ns
+                if next_t < t1 - period_ns:
+                    next_t = t1  # Fell behind (slow I2C), don't burst to catch up
+
+            _flush(ring, capacity, log_file, flushed, count)
+    finally:
+        shm.close()
+
+class PowerSampler:
+    # Samples the INA219 in a separate process at `rate_hz` into a shared-memory
+    # ring buffer of RECORD_DTYPE records, appending them to `log_path` in
+    # batches of `flush_every`. The inference process only pays for reading the
+    # ring when it asks for a window.
+    def __init__(self, log_path="power_samples.bin", rate_hz=1000, capacity=1 << 16, flush_every=1000,
+                 sensor_factory=open_ina219):
+        if flush_every >= capacity:
+            raise ValueError("flush_every must be smaller than the ring capacity")
+        self.log_path = log_path
+        self.rate_hz = rate_hz
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self.sensor_factory = sensor_factory
+        self.shm = None
+        self.process = None
+
+    def start(self):
+        size = HEADER_BYTES + self.capacity * RECORD_DTYPE.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.shm.buf[:HEADER_BYTES] = bytes(HEADER_BYTES)
+        self.head, self.ring = _ring_views(self.shm, self.capacity)
+
+        ctx = mp.get_context("spawn")
+        self.stop_event = ctx.Event()
+        ready_event = ctx.Event()
+        self.process = ctx.Process(
+            target=_sampler_main,
+            args=(self.shm.name, self.capacity, self.rate_hz, self.log_path, self.flush_every,
+                  self.stop_event, ready_event, self.sensor_factory),
+            daemon=True,
+        )
+        self.process.start()
+        while not ready_event.wait(0.1):
+            if not self.process.is_alive():
+                raise RuntimeError("Power sampler process failed to start")
+        print(f"[Power] Sampling INA219 at {self.rate_hz} Hz -> {self.log_path} (PID {self.process.pid})")
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.stop_event.set()
+            self.process.join()
+            self.process = None
+        if self.shm is not None:
+            count = self.sample_count()
+            del self.head, self.ring
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+            print(f"[Power] Stopped after {count} samples")
+
+    def sample_count(self):
+        return int(self.head[0])
+
+    def latest(self, n):
+        # Copy of the last n records (at most one ring's worth minus the flush margin)
+        end = self.sample_count()
+        start = max(0, end - min(n, self.capacity - self.flush_every))
+        idx = np.arange(start, end) % self.capacity
+        return self.ring[idx]
+
+    def window(self, t0_ns, t1_ns):
+        # Records with t0_ns <= t_ns < t1_ns that are still in the ring
+        records = self.latest(self.capacity)
+        lo, hi = np.searchsorted(records["t_ns"], [t0_ns, t1_ns])
+        return records[lo:hi]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def load_samples(log_path, t0_ns=None, t1_ns=None):
+    # Read a sampler log back (memory-mapped), optionally limited to [t0_ns, t1_ns)
+    if os.path.getsize(log_path) == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    records = np.memmap(log_path, dtype=RECORD_DTYPE, mode="r")
+    lo = 0 if t0_ns is None else np.searchsorted(records["t_ns"], t0_ns)
+    hi = len(records) if t1_ns is None else np.searchsorted(records["t_ns"], t1_ns)
+    return records[lo:hi]
+
+def export_csv(log_path, csv_path):
+    # Same layout as the idle/full-load captures in post-processing/
+    records = load_samples(log_path)
+    t_s = (records["t_ns"] - records["t_ns"][0]) / 1e9 if len(records) else np.zeros(0)
+    np.savetxt(csv_path, np.column_stack([t_s, records["power_w"]]), delimiter=",",
+               header="Time (s),Power (W)", comments="", fmt=["%.6f", "%.4f"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Standalone INA219 capture (Ctrl+C to stop)")
+    parser.add_argument("--out", default="power_samples.bin", help="Binary sample log")
+    parser.add_argument("--rate", type=float, default=1000, help="Sampling rate in Hz")
+    parser.add_argument("--csv", help="Also export Time/Power CSV when stopped")
+    args = parser.parse_args()
+
+    sampler = PowerSampler(args.out, rate_hz=args.rate)
+    sampler.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sampler.stop()
+        if args.csv:
+            export_csv(args.out, args.csv)
+            print(f"[Power] Exported {args.csv}")
@@ -0,0 +1,80 @@
+import threading
+import numpy as np
+
+class Preprocessor:
+    # Converts radiometric uint16 frames to the 3-channel uint8 input the model
+    # expects, writing into preallocated buffers instead of allocating float64
+    # temporaries for every frame.
+    #
+    # fixed_range: optional (lo, hi) in raw sensor counts. When set, a 65536-entry
+    #   lookup table is built once and frames are mapped through it, skipping the
+    #   per-frame min/max pass. Otherwise each frame is stretched to its own
+    #   min/max with integer arithmetic.
+    # num_buffers: number of output buffers cycled through. Each call reuses the
+    #   oldest one, so it must be at least the number of preprocessed frames alive
+    #   at the same time (queued, in flight on the accelerator, ...).
+    def __init__(self, fixed_range=None, num_buffers=1):
+        self.fixed_range = fixed_range
+        self.num_buffers = max(1, num_buffers)
+        self._slots = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+        self._lut = None
+        if fixed_range is not None:
+            lo, hi = int(fixed_range[0]), int(fixed_range[1])
+            if hi <= lo:
+                raise ValueError(f"Invalid fixed range: {fixed_range}")
+            values = np.clip(np.arange(65536, dtype=np.int64), lo, hi) - lo
+            self._lut = (values * 255 // (hi - lo)).astype(np.uint8)
+
+    def _slot(self, shape):
+        with self._lock:
+            slots = self._slots.get(shape)
+            if slots is None:
+                slots = [None] * self.num_buffers
+                self._slots[shape] = slots
+            index = self._next % self.num_buffers
+            self._next += 1
+            if slots[index] is None:
+                slots[index] = {
+                    "gray": np.empty(shape, dtype=np.uint8),
+                    "scratch": np.empty(shape, dtype=np.uint32),
+                }
+            return slots[index]
+
+    def to_uint8(self, np_image, out, scratch):
+        if self._lut is not None:
+            np.take(self._lut, np_image, out=out)
+            return out
+
+        lo = int(np_image.min())
+        span = int(np_image.max()) - lo
+        if span == 0:
+            out.fill(0)
+            return out
+
+        # (x - lo) * 255 // span, all in uint32 (max 65535 * 255 fits)
+        np.subtract(np_image, np_image.dtype.type(lo), out=scratch, casting="unsafe")
+        np.multiply(scratch, 255, out=scratch)
+        np.floor_divide(scratch, span, out=scratch)
+        np.copyto(out, scratch, casting="unsafe")
+        return out
+
+    def __call__(self, np_image):
+        if np_image.ndim == 3 and np_image.shape[2] == 1:
+            np_image = np_image[:, :, 0]
+        if np_image.ndim == 3:
+            return np_image  # Already multi-channel
+
+        slot = self._slot(np_image.shape)
+        if np_image.dtype == np.uint16:
+            gray = self.to_uint8(np_image, slot["gray"], slot["scratch"])
+        elif np_image.dtype == np.uint8:
+            gray = np_image
+        else:
+            gray = slot["gray"]
+            np.copyto(gray, np_image, casting="unsafe")
+
+        # Same pixel in every channel: zero-copy read-only view
+        return np.broadcast_to(gray[:, :, None], gray.shape + (3,))
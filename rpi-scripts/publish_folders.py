@@ -1,20 +1,79 @@
 import os
-import queue
-import zenoh
+import re
 import time
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import zenoh
+import wire_codec
+import sync_manifest
+import delta_sync
+import frame_source
+import tracing
 
 WORKDIR = "/home/ggeorgiou/storage/pv-hawk-tutorial/workdir"
 FOLDERS_TO_SEND = ["splitted", "quadrilaterals", "tracking"]
 #FOLDERS_TO_SEND = ["quadrilaterals", "tracking"]
+CHUNKED_FILES = ["quadrilaterals/quadrilaterals.pkl", "tracking/tracks.csv"]
+CHUNK_SIZE = 128 * 1024
+# The subscriber only accepts ids matching this, as they name a directory there.
+# "default" is its name for the publisher without an id (plain workdir/ keys)
+PUBLISHER_ID = r"[\w-]+"
+DEFAULT_PUBLISHER = "default"
+
+class WindowedSender:
+    # Keeps up to `window` puts unacknowledged at once instead of waiting for
+    # each ACK before the next put. Every key is ACKed individually by the
+    # subscriber (selective ACK), so ACKs may arrive in any order; a put whose
+    # ACK has not arrived after `timeout` seconds is sent again.
+    # window=1 is the old stop-and-wait behaviour.
+    def __init__(self, session, window=16, timeout=2.0, max_retries=10):
+        self.session = session
+        self.window = window
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pending = {}  # zenoh_key -> [payload, attachment, sent_at, retries]
+        self.cond = threading.Condition()
+        self.retransmits = 0
 
-acks = queue.Queue()
+    def on_ack(self, sample):
+        key = str(sample.key_expr)[len("ack/"):]
+        with self.cond:
+            if self.pending.pop(key, None) is not None:
+                self.cond.notify_all()
+
+    def _retransmit_expired(self):
+        now = time.time()
+        for key, entry in self.pending.items():
+            payload, attachment, sent_at, retries = entry
+            if now - sent_at < self.timeout:
+                continue
+            if retries >= self.max_retries:
+                raise TimeoutError(f"No ACK for {key} after {retries} retransmits")
+            print(f"[Publisher] ACK timeout, resending {key}")
+            self.session.put(key, payload, attachment=attachment)
+            entry[2] = now
+            entry[3] = retries + 1
+            self.retransmits += 1
 
-def ack_listener(sample):
-    ack_key = str(sample.key_expr)
-    print(f"[Publisher] Received ACK for {ack_key}")
-    acks.put(ack_key)
+    def _wait(self, predicate):
+        # Called with self.cond held
+        while not predicate():
+            self.cond.wait(self.timeout / 4)
+            self._retransmit_expired()
 
-def split_file(filepath, chunk_size=128*1024):  
+    def send(self, key, payload, attachment=None):
+        with self.cond:
+            self._wait(lambda: len(self.pending) < self.window)
+            self.pending[key] = [payload, attachment, time.time(), 0]
+        self.session.put(key, payload, attachment=attachment)
+
+    def drain(self):
+        with self.cond:
+            self._wait(lambda: not self.pending)
+
+def split_file(filepath, chunk_size=CHUNK_SIZE):
     with open(filepath, 'rb') as f:
         chunk_id = 0
         while True:
@@ -24,90 +83,282 @@ def split_file(filepath, chunk_size=128*1024):
             yield chunk_id, chunk
             chunk_id += 1
 
-def publish_folder(session, folder_path, key_prefix):
+def list_files(folder_path):
+    # Relative paths of the files in `folder_path` that get sent
     for root, dirs, files in os.walk(folder_path):
         for file in files:
+            if file.startswith("."):
+                continue  # Bookkeeping files such as the frame index cache
             file_path = os.path.join(root, file)
             relative_path = os.path.relpath(file_path, WORKDIR).replace(os.sep, '/')
+            # Entire frames go raw, the CHUNKED_FILES in chunks; ignore other files if any
+            if relative_path.startswith("splitted/") or relative_path in CHUNKED_FILES:
+                yield relative_path
 
-            if relative_path.startswith("splitted/"):
-                # Send entire file raw, no chunking
-                zenoh_key = f"{key_prefix}/{relative_path}"
-                with open(file_path, "rb") as f_in:
-                    content = f_in.read()
-                print(f"[Publisher] Sending raw file {file_path} -> {zenoh_key} (size: {len(content)})")
-                session.put(zenoh_key, content)
-
-                expected_ack = f"ack/{zenoh_key}"
-                print(f"[Publisher] Waiting for ACK of {expected_ack}...")
-                while True:
-                    ack_received = acks.get()
-                    if ack_received == expected_ack:
-                        print(f"[Publisher] ACK confirmed for {zenoh_key}")
-                        break
-
-            elif relative_path in ["quadrilaterals/quadrilaterals.pkl", "tracking/tracks.csv"]:
-                # Send these specific files chunked as before
-                print(f"[Publisher] Sending chunked file {relative_path} -> {file_path}")
-                for chunk_id, chunk in split_file(file_path):
-                    zenoh_key = f"{key_prefix}/{relative_path}.chunk{chunk_id}"
-                    print(f"[Publisher] Sending chunk {chunk_id} -> {zenoh_key} (size: {len(chunk)})")
-                    session.put(zenoh_key, chunk)
-
-                    expected_ack = f"ack/{zenoh_key}"
-                    print(f"[Publisher] Waiting for ACK of {expected_ack}...")
-                    while True:
-                        ack_received = acks.get()
-                        if ack_received == expected_ack:
-                            print(f"[Publisher] ACK confirmed for {zenoh_key}")
-                            break
-
-                # Send end-of-file marker after all chunks sent
-                end_key = f"{key_prefix}/{relative_path}.end"
-                session.put(end_key, b"EOF")
-                print(f"[Publisher] Sent end signal for {relative_path}")
-
-                expected_ack = f"ack/{end_key}"
-                print(f"[Publisher] Waiting for ACK of {expected_ack}...")
-                while True:
-                    ack_received = acks.get()
-                    if ack_received == expected_ack:
-                        print(f"[Publisher] ACK confirmed for {end_key}")
-                        break
+def chunk_messages(key_prefix, relative_path, chunks, total, digest, skip=()):
+    # Chunks carry their byte offset, the file size and the file's content hash,
+    # so the subscriber can write them in place and resume an interrupted
+    # transfer of the same content; chunks it already has are skipped.
+    num_chunks = 0
+    for chunk_id, chunk in chunks:
+        num_chunks += 1
+        if chunk_id in skip:
+            continue
+        meta = {"offset": chunk_id * CHUNK_SIZE, "total": total, "hash": digest}
+        yield f"{key_prefix}/{relative_path}.chunk{chunk_id}", relative_path, chunk, meta, True
+    if skip:
+        print(f"[Publisher] Resuming {relative_path}: {len(skip)}/{num_chunks} chunks already received")
 
-            else:
-                # Ignore other files if any
-                continue
+    # End-of-file marker carries the chunk count, so the subscriber can
+    # reassemble once every chunk is in, whatever order they arrive in, and the
+    # size, in case every chunk was already received before a restart
+    yield (f"{key_prefix}/{relative_path}.end", relative_path, f"EOF {num_chunks}".encode(),
+           {"hash": digest, "total": total}, False)
 
+def file_messages(relative_paths, key_prefix, manifest, have_chunks, deltas=None):
+    # Yields (zenoh_key, relative_path, data, meta, compressible) in send order.
+    # Raw files are yielded as a path and read by the compression worker.
+    # A file with an entry in `deltas` is sent as <relative_path>.delta instead.
+    deltas = deltas or {}
+    for relative_path in relative_paths:
+        file_path = os.path.join(WORKDIR, relative_path)
+        digest = manifest[relative_path]["hash"]
 
+        if relative_path in deltas:
+            delta = deltas[relative_path]
+            chunks = enumerate(delta[i:i + CHUNK_SIZE] for i in range(0, len(delta), CHUNK_SIZE))
+            yield from chunk_messages(key_prefix, relative_path + ".delta", chunks, len(delta),
+                                      sync_manifest.digest_bytes(delta))
+        elif relative_path in CHUNKED_FILES:
+            yield from chunk_messages(key_prefix, relative_path, split_file(file_path),
+                                      manifest[relative_path]["size"], digest,
+                                      have_chunks.get(relative_path, set()))
+        else:
+            yield f"{key_prefix}/{relative_path}", relative_path, file_path, {"hash": digest}, True
 
-def main():
-    start_time = time.time()
-    conf = zenoh.Config()
-    # conf.insert_json5("connect/endpoints", '["tcp:<SERVER_IP>:7447"]')
+def prepare_deltas(session, relative_paths, manifest, timeout, key_prefix="workdir", max_ratio=0.8):
+    # Block deltas against the subscriber's current copy, for the files where
+    # it has one and the delta is clearly smaller than the file
+    deltas = {}
+    for relative_path in relative_paths:
+        signatures = delta_sync.request_signatures(session, relative_path, timeout=timeout, key_prefix=key_prefix)
+        if signatures is None:
+            continue
+        base_hash, block_size, weak, strong = signatures
+        with tracing.span("delta", "publish", relative_path) as span:
+            ops, literals = delta_sync.compute_delta(os.path.join(WORKDIR, relative_path), block_size, weak, strong)
+            size = manifest[relative_path]["size"]
+            delta = delta_sync.encode_delta(base_hash, manifest[relative_path]["hash"], size, ops, literals)
+        print(f"[Publisher] Delta for {relative_path}: {len(delta)} of {size} bytes "
+              f"({len(ops)} ops, {block_size} B blocks, {span.seconds:.2f} s)")
+        if len(delta) < max_ratio * size:
+            deltas[relative_path] = delta
+    return deltas
 
-    print("[Publisher] Connecting to Zenoh...")
-    session = zenoh.open(conf)
+def encode_message(message, codec, level):
+    zenoh_key, relative_path, data, meta, compressible = message
+    with tracing.span("encode", "publish", relative_path):
+        if isinstance(data, str):
+            with open(data, "rb") as f_in:
+                data = f_in.read()
+        if not compressible:
+            return zenoh_key, relative_path, data, wire_codec.make_attachment(meta), None, 0.0
+        payload, attachment, codec_time = wire_codec.encode(data, codec, level, meta)
+    return zenoh_key, relative_path, payload, attachment, len(data), codec_time
 
-    # Start subscriber to acks
-    session.declare_subscriber("ack/**", ack_listener)
+class TransferReport:
+    # Per-file sizes before/after the codec and time spent compressing
+    def __init__(self, codec):
+        self.codec = codec
+        self.current = None
+        self.totals = [0, 0, 0.0]
 
-    try:
-        for folder in FOLDERS_TO_SEND:
-            folder_path = os.path.join(WORKDIR, folder)
-            if os.path.exists(folder_path):
-                publish_folder(session, folder_path, "workdir")
+    def add(self, relative_path, raw_size, wire_size, codec_time):
+        if self.current is not None and self.current[0] != relative_path:
+            self._print_file()
+        if self.current is None:
+            self.current = [relative_path, 0, 0, 0.0]
+        self.current[1] += raw_size
+        self.current[2] += wire_size
+        self.current[3] += codec_time
+
+    def _print_file(self):
+        relative_path, raw_size, wire_size, codec_time = self.current
+        ratio = raw_size / wire_size if wire_size else 1.0
+        print(f"[Publisher] Sent {relative_path}: {raw_size} -> {wire_size} bytes "
+              f"({ratio:.2f}x, {self.codec} {codec_time * 1000:.1f} ms)")
+        for i in range(3):
+            self.totals[i] += self.current[i + 1]
+        self.current = None
+
+    def finish(self):
+        if self.current is not None:
+            self._print_file()
+        raw_size, wire_size, codec_time = self.totals
+        ratio = raw_size / wire_size if wire_size else 1.0
+        print(f"[Publisher] Total: {raw_size} -> {wire_size} bytes "
+              f"({ratio:.2f}x, {self.codec} {codec_time:.2f} s)")
+
+def send_encoded(sender, report, encoded):
+    zenoh_key, relative_path, payload, attachment, raw_size, codec_time = encoded
+    # Includes waiting for a free slot in the ACK window
+    with tracing.span("send", "publish", relative_path):
+        sender.send(zenoh_key, payload, attachment)
+    if raw_size is not None:
+        report.add(relative_path, raw_size, len(payload), codec_time)
+
+def publish_files(sender, messages, pool, report, codec="none", level=3, lookahead=32):
+    # Compression of the next `lookahead` messages runs in `pool` while the
+    # current ones are being sent and ACKed
+    futures = deque()
+    for message in messages:
+        futures.append(pool.submit(encode_message, message, codec, level))
+        if len(futures) >= lookahead:
+            send_encoded(sender, report, futures.popleft().result())
+    while futures:
+        send_encoded(sender, report, futures.popleft().result())
+
+def list_workdir_files():
+    files = []
+    for folder in FOLDERS_TO_SEND:
+        folder_path = os.path.join(WORKDIR, folder)
+        if os.path.exists(folder_path):
+            files.extend(list_files(folder_path))
+        else:
+            print(f"[Warning] Folder not found: {folder_path}")
+    return files
+
+def frame_files(frame_id):
+    # The files of one frame in every splitted/ subfolder (radiometric, preview, ...)
+    # Folder listings come from frame_source's cached index, not a listdir per frame
+    splitted = os.path.join(WORKDIR, "splitted")
+    return sorted(f"splitted/{folder}/{name}"
+                  for folder in frame_source.frame_names(splitted) if os.path.isdir(os.path.join(splitted, folder))
+                  for name in frame_source.names_for_id(os.path.join(splitted, folder), frame_id))
+
+def publisher_id_arg(value):
+    # argparse type for --publisher-id
+    if not re.fullmatch(PUBLISHER_ID, value):
+        raise argparse.ArgumentTypeError(f"invalid publisher id {value!r} (letters, digits, - and _ only)")
+    if value == DEFAULT_PUBLISHER:
+        raise argparse.ArgumentTypeError(f"publisher id {value!r} is reserved for publishers without an id")
+    return value
+
+def key_prefix_for(publisher_id):
+    # Several Pis can share one subscriber, each under fleet/<id>/workdir;
+    # without an id the keys stay under workdir/ as before
+    return f"fleet/{publisher_id}/workdir" if publisher_id else "workdir"
+
+class Publisher:
+    # One zenoh session sending WORKDIR files to the subscriber. main() syncs
+    # all FOLDERS_TO_SEND at once; run_per_frame.py --stream calls sync() with
+    # each frame's files as soon as the frame is processed, then finish().
+    def __init__(self, window=16, ack_timeout=2.0, codec="none", level=3, codec_workers=2,
+                 manifest_timeout=60.0, full=False, delta=False, publisher_id=None):
+        self.key_prefix = key_prefix_for(publisher_id)
+        conf = zenoh.Config()
+        # conf.insert_json5("connect/endpoints", '["tcp:<SERVER_IP>:7447"]')
+
+        print("[Publisher] Connecting to Zenoh...")
+        self.session = zenoh.open(conf)
+        self.sender = WindowedSender(self.session, window=window, timeout=ack_timeout)
+
+        # Start subscriber to acks
+        self.session.declare_subscriber(f"ack/{self.key_prefix}/**", self.sender.on_ack)
+
+        self.pool = ThreadPoolExecutor(max_workers=codec_workers)
+        self.codec = wire_codec.negotiate(self.session, codec, timeout=ack_timeout, key_prefix=self.key_prefix)
+        print(f"[Publisher] Using codec: {self.codec}" + (f" (level {level})" if self.codec != "none" else ""))
+        self.level = level
+        self.lookahead = 2 * window
+        self.manifest_timeout = manifest_timeout
+        self.full = full
+        self.delta = delta
+        self.report = TransferReport(self.codec)
+        # Content hashes are cached by (size, mtime), only new or changed files are read
+        self.hash_cache = sync_manifest.HashCache(WORKDIR)
+
+    def _publish(self, files, manifest, have_chunks, deltas=None):
+        messages = file_messages(files, self.key_prefix, manifest, have_chunks, deltas)
+        publish_files(self.sender, messages, self.pool, self.report, self.codec, self.level, self.lookahead)
+
+    def sync(self, files):
+        # Sends those of `files` (relative to WORKDIR) the subscriber is missing
+        # or has out of date. Returns once they are queued, not ACKed.
+        with tracing.span("manifest", "publish"):
+            manifest = sync_manifest.build_manifest(files, self.hash_cache)
+        have_chunks = {}
+        if not self.full:
+            with tracing.span("manifest_diff", "publish"):
+                wanted = sync_manifest.request_sync(self.session, manifest, timeout=self.manifest_timeout,
+                                                    key_prefix=self.key_prefix)
+            if wanted is None:
+                print("[Publisher] No manifest reply from subscriber, sending everything")
             else:
-                print(f"[Warning] Folder not found: {folder_path}")
+                print(f"[Publisher] Subscriber is missing {len(wanted)} of {len(files)} files")
+                files = [path for path in files if path in wanted]
+                have_chunks = wanted
+
+        deltas = {}
+        if self.delta and not self.full:
+            # Files with a resumable partial transfer are better off resumed
+            candidates = [path for path in files if path in CHUNKED_FILES and not have_chunks.get(path)]
+            deltas = prepare_deltas(self.session, candidates, manifest, self.manifest_timeout, self.key_prefix)
 
-        print("[Publisher] Selected folders sent and ACKed!")
-        session.put("workdir/done", b"ALL_FILES_SENT")
+        self._publish(files, manifest, have_chunks, deltas)
+
+        if deltas:
+            # The subscriber checks each patched file against its hash; any that
+            # did not come out right are sent again in full
+            self.sender.drain()
+            failed = sync_manifest.request_sync(self.session, {path: manifest[path] for path in deltas},
+                                                timeout=self.manifest_timeout, key_prefix=self.key_prefix)
+            if failed is None:
+                failed = {path: set() for path in deltas}
+            if failed:
+                print(f"[Publisher] Delta failed for {', '.join(failed)}, sending in full")
+                self._publish(list(failed), manifest, failed)
+
+    def finish(self):
+        with tracing.span("drain", "publish"):
+            self.sender.drain()
+        self.report.finish()
+        print(f"[Publisher] Selected folders sent and ACKed! ({self.sender.retransmits} retransmits)")
+        self.session.put(f"{self.key_prefix}/done", b"ALL_FILES_SENT")
         print("[Publisher] Completion signal sent.")
+
+    def close(self):
+        self.pool.shutdown()
+        self.session.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--window", type=int, default=16, help="Max unacknowledged files/chunks in flight (1 = stop-and-wait)")
+    parser.add_argument("--ack-timeout", type=float, default=2.0, help="Seconds before an unacknowledged put is resent")
+    parser.add_argument("--codec", choices=["none", "zstd", "lz4"], default="none", help="Payload compression, used only if the subscriber supports it")
+    parser.add_argument("--level", type=int, default=3, help="Compression level for the codec")
+    parser.add_argument("--codec-workers", type=int, default=2, help="Threads compressing ahead of the sender")
+    parser.add_argument("--manifest-timeout", type=float, default=60.0, help="Seconds to wait for the subscriber's manifest diff")
+    parser.add_argument("--full", action="store_true", help="Send every file, skipping the manifest exchange")
+    parser.add_argument("--delta", action="store_true", help="Send only changed blocks of the chunked files the subscriber has an older copy of")
+    parser.add_argument("--publisher-id", type=publisher_id_arg, help="Name of this Pi when several publish to one subscriber (letters, digits, - and _)")
+    parser.add_argument("--trace", metavar="CSV", help="Record manifest/encode/send spans to this CSV (and a Chrome trace .json next to it)")
+    args = parser.parse_args()
+
+    if args.trace:
+        tracing.start(args.trace, "publisher")
+    start_time = time.time()
+    publisher = Publisher(args.window, args.ack_timeout, args.codec, args.level, args.codec_workers,
+                          args.manifest_timeout, args.full, args.delta, args.publisher_id)
+    try:
+        publisher.sync(list_workdir_files())
+        publisher.finish()
     finally:
-        session.close()
+        publisher.close()
         end_time = time.time()  # <-- record end time
         elapsed_time = end_time - start_time
         print(f"[Publisher] Script finished in {elapsed_time:.2f} seconds.")
+        tracing.stop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
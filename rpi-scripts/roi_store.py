@@ -0,0 +1,158 @@
+import os
+import csv
+import argparse
+import numpy as np
+
+# All detection ROIs of a sequence in two append-only files instead of one
+# rois/<frame_id>.csv per frame:
+#   data.bin   ROI_DTYPE records, every frame's detections back to back
+#   index.bin  INDEX_DTYPE records, one per written frame: frame_id and the
+#              row range of its detections in data.bin
+# `frame` in a data row is the position of its frame in index.bin, so all
+# ROIs of a sequence load with one read and still know their frame. A frame
+# written twice (re-run) is shadowed by its latest entry.
+# RoiStore.export_csv() writes the legacy per-frame CSV layout
+# (x1,y1,x2,y2,1,score per line) for PV-Hawk's tracking.
+
+ROI_DTYPE = np.dtype([
+    ("frame", "<i4"),
+    ("x1", "<i4"),
+    ("y1", "<i4"),
+    ("x2", "<i4"),
+    ("y2", "<i4"),
+    ("label", "<i4"),
+    ("score", "<f8"),
+])
+INDEX_DTYPE = np.dtype([
+    ("frame_id", "S32"),
+    ("start", "<i8"),
+    ("count", "<i4"),
+])
+DATA_FILE = "data.bin"
+INDEX_FILE = "index.bin"
+
+def to_records(detections, frame=0):
+    records = np.zeros(len(detections), dtype=ROI_DTYPE)
+    if len(detections):
+        boxes = np.array([det["bbox"] for det in detections], dtype=np.float64).reshape(-1, 4)
+        records["frame"] = frame
+        for i, name in enumerate(("x1", "y1", "x2", "y2")):
+            records[name] = boxes[:, i]  # truncates like int()
+        records["label"] = 1
+        records["score"] = [det["score"] for det in detections]
+    return records
+
+def to_rows(records):
+    # [[x1, y1, x2, y2, 1, score], ...] as Python numbers, the legacy CSV rows
+    return [list(row) for row in zip(*(records[name].tolist() for name in ("x1", "y1", "x2", "y2", "label", "score")))]
+
+def write_csv(path, records):
+    # csv.writer like inference_yolo.py's per-frame CSVs (\r\n line ends)
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows(to_rows(records))
+
+class RoiWriter:
+    # Appends one frame's detections per call; single writer per store
+    def __init__(self, store_root):
+        os.makedirs(store_root, exist_ok=True)
+        data_path = os.path.join(store_root, DATA_FILE)
+        index_path = os.path.join(store_root, INDEX_FILE)
+
+        # Drop anything past the last complete index entry (interrupted write)
+        index = read_index(store_root)
+        self.frames = len(index)
+        self.rows = int(index["start"][-1] + index["count"][-1]) if len(index) else 0
+        self.data = open(data_path, "ab")
+        self.index = open(index_path, "ab")
+        self.data.truncate(self.rows * ROI_DTYPE.itemsize)
+        self.index.truncate(self.frames * INDEX_DTYPE.itemsize)
+
+    def append(self, frame_id, detections):
+        records = to_records(detections, self.frames)
+        entry = np.array([(frame_id.encode(), self.rows, len(records))], dtype=INDEX_DTYPE)
+        if entry["frame_id"][0].decode() != frame_id:
+            raise ValueError(f"Frame ID longer than {INDEX_DTYPE['frame_id'].itemsize} bytes: {frame_id}")
+        # Data before index, so an index entry never points past the data
+        self.data.write(records.tobytes())
+        self.data.flush()
+        self.index.write(entry.tobytes())
+        self.index.flush()
+        self.frames += 1
+        self.rows += len(records)
+        return records
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+def read_index(store_root):
+    path = os.path.join(store_root, INDEX_FILE)
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    raw = np.fromfile(path, dtype=np.uint8)
+    whole = len(raw) // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize
+    return raw[:whole].view(INDEX_DTYPE)
+
+class RoiStore:
+    def __init__(self, store_root):
+        self.store_root = store_root
+        self.index = read_index(store_root)
+        rows = int(self.index["start"][-1] + self.index["count"][-1]) if len(self.index) else 0
+        data_path = os.path.join(store_root, DATA_FILE)
+        self.data = np.memmap(data_path, dtype=ROI_DTYPE, mode="r", shape=(rows,)) if rows else np.zeros(0, ROI_DTYPE)
+        # frame_id -> latest index position
+        self.positions = {frame_id.decode(): i for i, frame_id in enumerate(self.index["frame_id"])}
+
+    def frame_ids(self):
+        return sorted(self.positions)
+
+    def frame(self, frame_id):
+        # Structured array of the frame's detections (empty if none or unknown)
+        position = self.positions.get(frame_id)
+        if position is None:
+            return np.zeros(0, dtype=ROI_DTYPE)
+        start, count = int(self.index["start"][position]), int(self.index["count"][position])
+        return np.array(self.data[start:start + count])
+
+    def range(self, first, last):
+        # Detections of every frame with first <= frame_id <= last (zero-padded
+        # IDs sort in sequence order), as one array
+        positions = [self.positions[f] for f in self.frame_ids() if first <= f <= last]
+        starts = self.index["start"][positions]
+        counts = self.index["count"][positions].astype(np.int64)
+        # Row numbers of all those frames, gathered in one fancy-indexed read
+        rows = np.arange(counts.sum()) + np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return np.array(self.data[rows]) if len(rows) else np.zeros(0, dtype=ROI_DTYPE)
+
+    def load_all(self):
+        # Every live detection in one array; frame_id of a row:
+        # self.index["frame_id"][row["frame"]]
+        live = np.zeros(len(self.index), dtype=bool)
+        live[list(self.positions.values())] = True
+        data = np.array(self.data)
+        return data[live[data["frame"]]] if len(data) else data
+
+    def export_csv(self, frame_id, roi_root):
+        os.makedirs(roi_root, exist_ok=True)
+        write_csv(os.path.join(roi_root, f"{frame_id}.csv"), self.frame(frame_id))
+
+    def export_all_csv(self, roi_root):
+        frame_ids = self.frame_ids()
+        for frame_id in frame_ids:
+            self.export_csv(frame_id, roi_root)
+        return len(frame_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a columnar ROI store to per-frame CSVs")
+    parser.add_argument("store_root", help="Directory holding data.bin and index.bin")
+    parser.add_argument("roi_root", help="Output directory for <frame_id>.csv")
+    parser.add_argument("--frame", type=str, help="Optional: export only this frame ID")
+    args = parser.parse_args()
+
+    store = RoiStore(args.store_root)
+    if args.frame:
+        store.export_csv(args.frame, args.roi_root)
+        print(f"Exported {len(store.frame(args.frame))} ROIs for {args.frame}")
+    else:
+        print(f"Exported {store.export_all_csv(args.roi_root)} frames to {args.roi_root}")
@@ -0,0 +1,223 @@
+import os
+import time
+import queue
+import argparse
+import threading
+import subprocess
+from inference_client import InferenceClient
+import tracing
+import frame_source
+
+try:
+    import publish_folders
+except ImportError:
+    # zenoh not installed, --stream unavailable
+    publish_folders = None
+
+WORKDIR = "/home/ggeorgiou/storage/pv-hawk-tutorial/workdir"
+CONTAINER_WORKDIR = "/storage/pv-hawk-tutorial/workdir"
+DOCKER_IMAGE = "pvhawk-pi5"
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+YOLO_SCRIPT = os.path.join(SCRIPT_DIR, "inference_server.py")
+YOLO_PYTHON = "/home/ggeorgiou/hailo/hailo_examples/degirum_env/bin/python3"
+SOCKET_PATH = "/tmp/hailo_inference.sock"
+FRAME_DIR = os.path.join(WORKDIR, "splitted/radiometric")
+TIMINGS_CSV = "frame_timings_seg_and_tracking.csv"
+PUBLISH_BATCH = 32  # most frames sent per manifest exchange with --stream
+
+def list_frame_ids(frame_dir):
+    return [os.path.splitext(f)[0] for f in frame_source.frame_names(frame_dir)]
+
+def start_segmentation_server(server_args):
+    log = open("inference_server.log", "w")
+    return subprocess.Popen([YOLO_PYTHON, YOLO_SCRIPT, "--socket", SOCKET_PATH] + server_args,
+                            stdout=log, stderr=subprocess.STDOUT)
+
+class TrackingWorker:
+    # One long-lived pvhawk container running tracking_worker.py
+    def __init__(self, pvhawk_dir):
+        cmd = [
+            "sudo", "docker", "run", "--rm", "-i",
+            "--ipc=host",
+            "--env=DISPLAY",
+            "--mount", "type=bind,src=/tmp/.X11-unix,dst=/tmp/.X11-unix",
+            "--mount", f"type=bind,src={pvhawk_dir},dst=/pvextractor",
+            "--mount", "type=volume,dst=/pvextractor/extractor/mapping/OpenSfm",
+            "--mount", "type=bind,src=/home/ggeorgiou/storage,dst=/storage",
+            "--mount", f"type=bind,src={os.path.join(SCRIPT_DIR, 'tracking_worker.py')},dst=/pvextractor/tracking_worker.py,readonly",
+            DOCKER_IMAGE,
+            "python", "-u", "tracking_worker.py", CONTAINER_WORKDIR,
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+        self._read_until(lambda line: line == "READY")
+
+    def _read_until(self, match):
+        for line in self.proc.stdout:
+            line = line.strip()
+            if match(line):
+                return line
+        raise RuntimeError("Tracking worker exited unexpectedly")
+
+    def track(self, frame_id):
+        self.proc.stdin.write(frame_id + "\n")
+        self.proc.stdin.flush()
+        line = self._read_until(lambda l: l.startswith("@@DONE ") and l.split()[1] == frame_id)
+        _, _, status, _ = line.split()
+        return status == "ok"
+
+    def close(self):
+        if self.proc.stdin:
+            self.proc.stdin.close()
+        self.proc.wait()
+
+def publish_frames(publisher, frame_queue, errors):
+    # Streaming mode: sends processed frames to the GPU host while the next
+    # ones are segmented and tracked. The frames finished during one sync go
+    # in the next, so a slow link costs one manifest exchange and hash cache
+    # write per batch instead of per frame
+    try:
+        done = False
+        while not done:
+            batch = [frame_queue.get()]
+            while len(batch) < PUBLISH_BATCH:
+                try:
+                    batch.append(frame_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch.remove(None)
+                done = True
+            if not batch:
+                continue
+            with tracing.span("publish", "per_frame", f"{batch[0]}-{batch[-1]}"):
+                publisher.sync([path for frame_id in batch for path in publish_folders.frame_files(frame_id)])
+    except Exception as e:
+        errors.append(e)
+
+def run(frame_ids, pvhawk_dir, server_args, lookahead=1, publisher=None):
+    server = start_segmentation_server(server_args)
+    print(f"Segmentation server PID: {server.pid}")
+    worker = None
+    seg_done = queue.Queue(maxsize=lookahead)
+    seg_error = []
+    publish_queue = queue.Queue()
+    publish_error = []
+    publish_thread = None
+
+    def segment_all():
+        # Segmentation runs ahead of tracking by at most `lookahead` frames
+        try:
+            with InferenceClient(SOCKET_PATH) as client:
+                for frame_id in frame_ids:
+                    # Round trip through the server, including its queueing
+                    with tracing.span("segmentation", "per_frame", frame_id) as seg:
+                        reply = client.process(frame_id)
+                    if reply["status"] != "ok":
+                        raise RuntimeError(f"Segmentation failed for frame {frame_id}: {reply.get('error', reply['status'])}")
+                    seg_done.put((frame_id, seg.start_ns / 1e9, seg.end_ns / 1e9))
+        except Exception as e:
+            seg_error.append(e)
+        finally:
+            seg_done.put(None)
+
+    try:
+        if publisher is not None:
+            # Everything in splitted/ that is not a frame (GPS, timestamps, ...) goes first
+            frame_set = set(frame_ids)
+            splitted = os.path.join(WORKDIR, "splitted")
+            publisher.sync([path for path in publish_folders.list_files(splitted)
+                            if os.path.splitext(os.path.basename(path))[0] not in frame_set])
+            publish_thread = threading.Thread(target=publish_frames, args=(publisher, publish_queue, publish_error), daemon=True)
+            publish_thread.start()
+
+        print("Starting tracking worker...")
+        worker = TrackingWorker(pvhawk_dir)
+        seg_thread = threading.Thread(target=segment_all, daemon=True)
+        seg_thread.start()
+
+        with open(TIMINGS_CSV, "w") as csv_file:
+            # duration_sec is end-to-end (segmentation start -> tracking end);
+            # inter_frame_latency_sec is negative when consecutive frames overlap
+            csv_file.write("frame_id,duration_sec,inter_frame_latency_sec,segmentation_sec,wait_for_tracking_sec,tracking_sec\n")
+            last_end_time = None
+
+            while True:
+                item = seg_done.get()
+                if item is None:
+                    break
+                frame_id, seg_start, seg_end = item
+                print(f"=== Tracking frame: {frame_id} ===")
+
+                with tracing.span("tracking", "per_frame", frame_id) as track:
+                    ok = worker.track(frame_id)
+                if not ok:
+                    print(f"[WARN] Tracking failed for frame {frame_id}")
+                track_start, end_time = track.start_ns / 1e9, track.end_ns / 1e9
+
+                inter_latency = seg_start - last_end_time if last_end_time is not None else 0.0
+                csv_file.write(f"{frame_id},{end_time - seg_start:.3f},{inter_latency:.3f},{seg_end - seg_start:.3f},"
+                               f"{track_start - seg_end:.3f},{end_time - track_start:.3f}\n")
+                csv_file.flush()
+                print(f"=== Done with frame: {frame_id} in {end_time - seg_start:.3f} seconds ===")
+                last_end_time = end_time
+                publish_queue.put(frame_id)
+
+        if seg_error:
+            raise seg_error[0]
+
+        if publisher is not None:
+            publish_queue.put(None)
+            publish_thread.join()
+            if publish_error:
+                raise publish_error[0]
+            # Tracks and quadrilaterals are complete only now; frames that
+            # failed to send go again here
+            publisher.sync(publish_folders.list_workdir_files())
+            publisher.finish()
+    finally:
+        print("All frames processed. Cleaning up...")
+        if publish_thread is not None:
+            # No-op after a normal run; after an error lets the thread exit
+            publish_queue.put(None)
+        if worker is not None:
+            worker.close()
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-frame segmentation + tracking with persistent workers")
+    parser.add_argument("--pvhawk-dir", default=os.getcwd(), help="PV-Hawk checkout mounted at /pvextractor (default: cwd)")
+    parser.add_argument("--lookahead", type=int, default=1, help="Frames segmentation may run ahead of tracking")
+    parser.add_argument("--stream", action="store_true", help="Publish each frame to the GPU host as soon as it is processed")
+    parser.add_argument("--codec", choices=["none", "zstd", "lz4"], default="none", help="Payload compression for --stream")
+    parser.add_argument("--publisher-id", help="Name of this Pi for --stream when several publish to one subscriber")
+    parser.add_argument("--trace", metavar="CSV", help="Record per-frame spans to this CSV; the server traces to <CSV>_server.csv")
+    args, server_args = parser.parse_known_args()
+    if args.stream:
+        if publish_folders is None:
+            parser.error("--stream needs zenoh (pip install eclipse-zenoh)")
+        if args.publisher_id is not None:
+            try:
+                publish_folders.publisher_id_arg(args.publisher_id)
+            except argparse.ArgumentTypeError as e:
+                parser.error(f"argument --publisher-id: {e}")
+
+    if args.trace:
+        tracing.start(args.trace, "run_per_frame")
+        server_args += ["--trace", os.path.splitext(args.trace)[0] + "_server.csv"]
+    start = time.monotonic()
+    frame_ids = list_frame_ids(FRAME_DIR)
+    print(f"Found {len(frame_ids)} frames to process.")
+    publisher = None
+    if args.stream:
+        publisher = publish_folders.Publisher(codec=args.codec, delta=True, publisher_id=args.publisher_id)
+    try:
+        run(frame_ids, args.pvhawk_dir, server_args, args.lookahead, publisher)
+    finally:
+        if publisher is not None:
+            publisher.close()
+        tracing.stop()
+
+    elapsed = int(time.monotonic() - start)
+    print(f"=== Total time: {elapsed // 60} minutes and {elapsed % 60} seconds ===")
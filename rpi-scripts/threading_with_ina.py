@@ -1,26 +1,25 @@
-import threading
 from inference_yolo import run_inference
-from ina219_simpletest import start_power_monitoring
+from power_sampler import PowerSampler, export_csv
 
-def main():
-    stop_event = threading.Event()
-
-    # Start INA monitor in a separate thread
-    ina_thread = threading.Thread(
-        target=start_power_monitoring,
-        args=(stop_event, "test.txt"),
-        daemon=True
-    )
-    ina_thread.start()
+POWER_LOG = "power_samples.bin"
+POWER_CSV = "power_samples.csv"
+EVENT_LOG = "inference_events.bin"
 
-    # Run inference in the main thread
-    run_inference()
+def main():
+    # INA219 is sampled in its own process (see power_sampler.py), so it
+    # neither competes for the GIL nor writes text for every sample
+    sampler = PowerSampler(POWER_LOG, rate_hz=1000)
+    sampler.start()
 
-    # Signal INA to stop after inference is done
-    stop_event.set()
-    ina_thread.join()
+    try:
+        # Run inference in the main process, marking every stage on the sampler's clock
+        run_inference(event_log_path=EVENT_LOG)
+    finally:
+        # Stop sampling after inference is done
+        sampler.stop()
 
-    print("\nAll done. Power log saved to 'power_log.txt'.")
+    export_csv(POWER_LOG, POWER_CSV)
+    print(f"\nAll done. Power samples saved to '{POWER_LOG}' and '{POWER_CSV}', stage markers to '{EVENT_LOG}'.")
 
 if __name__ == "__main__":
     main()
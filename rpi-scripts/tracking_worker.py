@@ -0,0 +1,56 @@
+import sys
+import time
+import runpy
+import traceback
+import contextlib
+
+# Runs inside the pvhawk container (cwd /pvextractor) for a whole sequence.
+# Reads one frame ID per line on stdin and runs PV-Hawk's per-frame tracking
+# + quadrilaterals step (main.py <workdir> --frame_id <id>) in this process,
+# so container start-up and the heavy imports are paid once instead of per
+# frame. main.py's own output goes to stderr; stdout only carries
+#   READY
+#   @@DONE <frame_id> <ok|error> <seconds>
+
+MAIN_SCRIPT = "main.py"
+DONE_PREFIX = "@@DONE"
+
+def run_frame(workdir, frame_id):
+    saved_argv = sys.argv
+    sys.argv = [MAIN_SCRIPT, workdir, "--frame_id", frame_id]
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            runpy.run_path(MAIN_SCRIPT, run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise
+    finally:
+        sys.argv = saved_argv
+
+def main():
+    workdir = sys.argv[1]
+    protocol_out = sys.stdout
+    print("READY", file=protocol_out, flush=True)
+
+    for line in sys.stdin:
+        frame_id = line.strip()
+        if not frame_id:
+            continue
+
+        start = time.monotonic()
+        status = "ok"
+        try:
+            run_frame(workdir, frame_id)
+        except SystemExit as e:
+            # main.py called sys.exit() with a failure code; the worker keeps going
+            print(f"main.py exited with code {e.code} on frame {frame_id}", file=sys.stderr)
+            status = "error"
+        except Exception:
+            # KeyboardInterrupt is not caught, so Ctrl+C still stops the worker
+            traceback.print_exc(file=sys.stderr)
+            status = "error"
+        duration = time.monotonic() - start
+        print(f"{DONE_PREFIX} {frame_id} {status} {duration:.4f}", file=protocol_out, flush=True)
+
+if __name__ == "__main__":
+    main()
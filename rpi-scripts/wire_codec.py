@@ -0,0 +1,104 @@
+import time
+import threading
+
+# Optional payload compression for the publisher/subscriber transfers.
+# Shared by rpi-scripts and gpu-scripts, keep both copies identical.
+#
+# Puts carry their metadata as "key=value;..." in the attachment. A compressed
+# put announces its codec there ("codec=zstd;size=<raw bytes>"); a put without
+# codec field is raw, which is also what older subscribers expect. The subscriber lists the codecs it can
+# decode on the codecs/<key prefix> queryable and the publisher only
+# compresses with a codec both sides have.
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+_local = threading.local()
+
+def _zstd_compress(data, level):
+    # ZstdCompressor objects are not thread-safe, keep one per worker thread
+    compressors = getattr(_local, "zstd", None)
+    if compressors is None:
+        compressors = _local.zstd = {}
+    if level not in compressors:
+        compressors[level] = zstandard.ZstdCompressor(level=level)
+    return compressors[level].compress(data)
+
+COMPRESSORS = {}
+DECOMPRESSORS = {"none": lambda data, size: data}
+if zstandard is not None:
+    COMPRESSORS["zstd"] = _zstd_compress
+    DECOMPRESSORS["zstd"] = lambda data, size: zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+if lz4 is not None:
+    COMPRESSORS["lz4"] = lambda data, level: lz4.frame.compress(data, compression_level=level)
+    DECOMPRESSORS["lz4"] = lambda data, size: lz4.frame.decompress(data)
+
+# ==== Publisher side ====
+
+def negotiate(session, wanted, timeout=2.0, key_prefix="workdir"):
+    # Returns `wanted` if both sides support it, otherwise "none"
+    if wanted == "none":
+        return "none"
+    if wanted not in COMPRESSORS:
+        print(f"[Publisher] Codec {wanted} not installed here, sending uncompressed")
+        return "none"
+
+    supported = set()
+    for reply in session.get(f"codecs/{key_prefix}", timeout=timeout):
+        if reply.ok is not None:
+            supported.update(bytes(reply.ok.payload).decode().split(","))
+    if wanted not in supported:
+        print(f"[Publisher] Subscriber does not support {wanted} (has: {sorted(supported) or 'no reply'}), sending uncompressed")
+        return "none"
+    return wanted
+
+def make_attachment(meta):
+    if not meta:
+        return None
+    return ";".join(f"{k}={v}" for k, v in meta.items()).encode()
+
+def encode(data, codec, level, meta=None):
+    # Returns (payload, attachment, codec_seconds); `meta` is extra
+    # attachment fields sent along with the codec ones
+    meta = dict(meta or {})
+    if codec == "none":
+        return data, make_attachment(meta), 0.0
+    start = time.perf_counter()
+    payload = COMPRESSORS[codec](data, level)
+    elapsed = time.perf_counter() - start
+    if len(payload) >= len(data):
+        # Incompressible (e.g. already packed data), not worth decoding
+        return data, make_attachment(meta), elapsed
+    meta.update(codec=codec, size=len(data))
+    return payload, make_attachment(meta), elapsed
+
+# ==== Subscriber side ====
+
+def parse_attachment(attachment):
+    if attachment is None:
+        return {}
+    fields = bytes(attachment).decode().split(";")
+    return dict(field.split("=", 1) for field in fields if "=" in field)
+
+def decode(payload, meta):
+    # `meta` is the parsed attachment
+    codec = meta.get("codec", "none")
+    if codec not in DECOMPRESSORS:
+        raise ValueError(f"Unsupported codec {codec}")
+    return DECOMPRESSORS[codec](payload, int(meta.get("size", 0)))
+
+def declare_codecs_queryable(session):
+    # Same answer for every publisher's key prefix
+    supported = ",".join(DECOMPRESSORS)
+
+    def on_query(query):
+        query.reply(query.key_expr, supported.encode())
+
+    return session.declare_queryable("codecs/**", on_query)